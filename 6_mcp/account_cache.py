@@ -0,0 +1,192 @@
+import atexit
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from accounts import Account
+
+load_dotenv(override=True)
+
+# Seconds a cached account is trusted before it is reloaded to pick up other processes' writes
+ACCOUNT_CACHE_TTL = float(os.getenv("ACCOUNT_CACHE_TTL", "5"))
+# If positive, saves are deferred and written at most this many seconds later; 0 writes through
+ACCOUNT_WRITE_BEHIND = float(os.getenv("ACCOUNT_WRITE_BEHIND", "0"))
+
+
+class AccountCache:
+    """
+    An identity map of the accounts this process works with: one live Account per name.
+
+    Back-to-back calls for the same account skip the database read and model validation. Every
+    operation goes through use(), which holds the account's lock, so concurrent tool calls on one
+    account take turns while different accounts proceed in parallel. Our own saves update the
+    cached object in place. Another process's writes are picked up once an entry is older than
+    ttl. They are also picked up at once if they make one of our saves conflict, because the
+    operation then reloads and retries.
+
+    With write_behind set, a save only marks the account dirty, and a background thread writes it
+    within that many seconds. Only portfolio values are ever deferred, since trades flush before
+    they return. If another process saved the account in the meantime, the deferred values are
+    recorded again on top of its latest state. If the write still fails, the changes stay pending
+    and the account's next use writes them first, so the error reaches that caller.
+    """
+
+    def __init__(self, ttl: float = ACCOUNT_CACHE_TTL, write_behind: float = ACCOUNT_WRITE_BEHIND):
+        self.ttl = ttl
+        self.write_behind = write_behind
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._accounts = {}
+        self._loaded = {}
+        self._account_locks = {}
+        self._dirty = {}
+        self._failed = {}
+        if write_behind > 0:
+            threading.Thread(target=self._run, name="account-write-behind", daemon=True).start()
+
+    def _account_lock(self, name: str) -> threading.RLock:
+        with self._lock:
+            return self._account_locks.setdefault(name, threading.RLock())
+
+    def _get(self, name: str) -> Account:
+        """Return the cached account, loading or refreshing it first if needed. Call with its lock held."""
+        with self._lock:
+            account = self._accounts.get(name)
+            if account is not None and (name in self._dirty or time.monotonic() - self._loaded[name] < self.ttl):
+                self.hits += 1
+                return account
+            self.misses += 1
+        if account is None:
+            account = Account.get(name)
+            if self.write_behind > 0:
+                account._write_behind = self._mark_dirty
+        else:
+            account.reload()
+        with self._lock:
+            self._accounts[name] = account
+            self._loaded[name] = time.monotonic()
+        return account
+
+    def use(self, name: str, fn):
+        """
+        Call fn with the cached Account for name while holding that account's lock, and return its result.
+
+        If fn raises, the cached object may be half updated, whatever the error, so it is dropped.
+        Any portfolio values that earlier operations left pending are recorded again on a fresh copy.
+        """
+        name = name.lower()
+        with self._account_lock(name):
+            with self._lock:
+                failed = name in self._failed
+            if failed:
+                self._flush(name, raise_errors=True)
+            account = self._get(name)
+            deferred = account.pending_values()
+            try:
+                return fn(account)
+            except Exception:
+                self._drop(name)
+                if deferred:
+                    self._restore(name, deferred)
+                raise
+
+    def _restore(self, name: str, values: list[tuple[str, float]]) -> None:
+        """Record deferred portfolio values again on a freshly loaded account. Call with its lock held."""
+        account = self._get(name)
+        for timestamp, value in values:
+            account._record_value(timestamp, value)
+        self._mark_dirty(name)
+
+    def _drop(self, name: str) -> None:
+        with self._lock:
+            self._accounts.pop(name, None)
+            self._loaded.pop(name, None)
+            self._dirty.pop(name, None)
+            self._failed.pop(name, None)
+
+    def _mark_dirty(self, name: str) -> None:
+        with self._wake:
+            self._dirty.setdefault(name.lower(), time.monotonic() + self.write_behind)
+            self._wake.notify()
+
+    def _flush(self, name: str, raise_errors: bool = False) -> None:
+        """
+        Write an account's pending changes. If that fails they stay pending, to be retried after
+        another write_behind seconds or by the account's next use, and the error is raised if asked.
+        """
+        with self._account_lock(name):
+            with self._lock:
+                if self._dirty.pop(name, None) is None:
+                    return
+                account = self._accounts[name]
+            try:
+                account.flush_deferred()
+            except Exception as e:
+                with self._wake:
+                    self.failures += 1
+                    self._failed[name] = e
+                    self._dirty[name] = time.monotonic() + self.write_behind
+                if raise_errors:
+                    raise
+                return
+            with self._lock:
+                self.flushes += 1
+                self._failed.pop(name, None)
+
+    def _run(self) -> None:
+        while True:
+            with self._wake:
+                while not self._dirty:
+                    self._wake.wait()
+                now = time.monotonic()
+                wait = min(self._dirty.values()) - now
+                if wait > 0:
+                    self._wake.wait(wait)
+                    continue
+                due = [name for name, deadline in self._dirty.items() if deadline <= now]
+            for name in due:
+                self._flush(name)
+
+    def flush(self) -> None:
+        """Write every pending change now, raising the first error once every account has been tried."""
+        with self._lock:
+            names = list(self._dirty)
+        errors = []
+        for name in names:
+            try:
+                self._flush(name, raise_errors=True)
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def invalidate(self, name: str | None = None) -> None:
+        """Write any pending changes, then forget one account, or every account if name is None."""
+        with self._lock:
+            names = [name.lower()] if name else list(self._accounts)
+        for name in names:
+            with self._account_lock(name):
+                self._flush(name, raise_errors=True)
+                self._drop(name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "cached": len(self._accounts),
+                "dirty": len(self._dirty),
+                "flushes": self.flushes,
+                "failures": self.failures,
+                "failing": len(self._failed),
+            }
+
+
+account_cache = AccountCache()
+atexit.register(account_cache.flush)
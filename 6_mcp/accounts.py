@@ -1,28 +1,89 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Literal
+import functools
 import json
+import math
+import os
+from collections.abc import Callable
 from dotenv import load_dotenv
-from datetime import datetime
-from market import get_share_price
-from database import write_account, read_account, write_log
+from market import get_share_prices
+from database import create_account, write_account, read_account, update_account, write_log, ConcurrentUpdateError
+from storage import ACCOUNT_FIELDS
+from ledger import Ledger, Transaction
+from lots import LotBook, LOT_METHOD
+import clock
+import value_series
 
 load_dotenv(override=True)
 
 INITIAL_BALANCE = 10_000.0
 SPREAD = 0.002
+MAX_CONFLICT_RETRIES = 5
+# How many of the latest transactions an account summary includes by default
+SUMMARY_TRANSACTIONS = 10
+VERIFY_PNL = os.getenv("VERIFY_PNL", "false").strip().lower() == "true"
 
 
-class Transaction(BaseModel):
+class Order(BaseModel):
     symbol: str
+    side: Literal["buy", "sell"]
     quantity: int
-    price: float
-    timestamp: str
     rationale: str
+    lot_ids: list[int] | None = None
 
-    def total(self) -> float:
-        return self.quantity * self.price
-    
-    def __repr__(self):
-        return f"{abs(self.quantity)} shares of {self.symbol} at {self.price} each."
+
+def apply_to_cost_basis(cost_basis: dict[str, float], held: int, transaction: Transaction) -> float:
+    """
+    Update the average cost basis in place for one transaction, given the quantity held before it.
+
+    Buys add their cost to the position; sells remove their share of the position's average cost.
+    Returns the profit or loss the transaction realized, which is zero for a buy.
+    """
+    symbol = transaction.symbol
+    if transaction.quantity > 0:
+        cost_basis[symbol] = cost_basis.get(symbol, 0.0) + transaction.total()
+        return 0.0
+    sold = -transaction.quantity
+    average = cost_basis.get(symbol, 0.0) / held if held > 0 else transaction.price
+    if held - sold > 0:
+        cost_basis[symbol] = cost_basis.get(symbol, 0.0) - average * sold
+    else:
+        cost_basis.pop(symbol, None)
+    return sold * (transaction.price - average)
+
+
+def replay_cost_basis(transactions: list[Transaction]) -> tuple[dict[str, float], float, float]:
+    """ Rebuild (cost_basis, net_spend, realized_pnl) from scratch by replaying every transaction. """
+    held, cost_basis, net_spend, realized_pnl = {}, {}, 0.0, 0.0
+    for transaction in transactions:
+        realized_pnl += apply_to_cost_basis(cost_basis, held.get(transaction.symbol, 0), transaction)
+        held[transaction.symbol] = held.get(transaction.symbol, 0) + transaction.quantity
+        net_spend += transaction.total()
+    return cost_basis, net_spend, realized_pnl
+
+
+def retry_on_conflict(method):
+    """
+    Re-run an Account operation against freshly loaded state if its save loses a race.
+
+    Saves are compare-and-swap on the account's version, so a concurrent writer makes the save
+    fail instead of being silently overwritten; the operation is then repeated from the latest
+    state, including any price lookups and validation it does. Portfolio values that earlier
+    operations left for the write-behind cache are recorded again on top of the latest state.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        for attempt in range(MAX_CONFLICT_RETRIES):
+            deferred = self.pending_values()
+            try:
+                return method(self, *args, **kwargs)
+            except ConcurrentUpdateError:
+                if attempt == MAX_CONFLICT_RETRIES - 1:
+                    raise
+                self.reload()
+                for timestamp, value in deferred:
+                    self._record_value(timestamp, value)
+    return wrapper
 
 
 class Account(BaseModel):
@@ -30,55 +91,219 @@ class Account(BaseModel):
     balance: float
     strategy: str
     holdings: dict[str, int]
-    transactions: list[Transaction]
+    transactions: Ledger
     portfolio_value_time_series: list[tuple[str, float]]
+    cost_basis: dict[str, float] = Field(default_factory=dict)
+    net_spend: float = 0.0
+    realized_pnl: float = 0.0
+    lot_method: str = LOT_METHOD
+
+    _lots: LotBook = PrivateAttr(default_factory=LotBook)
+    _saved_fields: dict = PrivateAttr(default_factory=dict)
+    _saved_holdings: dict[str, tuple[int, float]] = PrivateAttr(default_factory=dict)
+    _saved_transactions: int = PrivateAttr(default=0)
+    _saved_values: int = PrivateAttr(default=0)
+    _version: int = PrivateAttr(default=0)
+    _write_behind: Callable[[str], None] | None = PrivateAttr(default=None)
 
     @classmethod
     def get(cls, name: str):
         fields = read_account(name.lower())
         if not fields:
-            fields = {
+            # Another process may be creating it too: only the first create counts, and both read that back
+            create_account(name, {
                 "name": name.lower(),
                 "balance": INITIAL_BALANCE,
                 "strategy": "",
                 "holdings": {},
                 "transactions": [],
-                "portfolio_value_time_series": []
-            }
-            write_account(name, fields)
-        return cls(**fields)
-    
-    
+                "portfolio_value_time_series": [],
+                "cost_basis": {},
+                "net_spend": 0.0,
+                "realized_pnl": 0.0,
+                "lot_method": LOT_METHOD,
+            })
+            fields = read_account(name.lower())
+        version = fields.pop("version")
+        lots, lot_realized_pnl = fields.pop("lots", {}), fields.pop("lot_realized_pnl", {})
+        stale = fields.get("net_spend") is None
+        if stale:
+            fields = {key: value for key, value in fields.items() if key not in ("cost_basis", "net_spend", "realized_pnl")}
+        stale_lots = fields.get("lot_method") is None
+        if stale_lots:
+            fields.pop("lot_method", None)
+        account = cls(**fields)
+        if stale_lots:
+            account._lots = LotBook.replay(account.transactions, account.lot_method)
+        else:
+            account._lots = LotBook(lots, lot_realized_pnl)
+        if stale:
+            # Saved before running P&L was tracked: rebuild it, and write it back with the next save
+            account.cost_basis, account.net_spend, account.realized_pnl = replay_cost_basis(account.transactions)
+        account._mark_saved(version)
+        if stale:
+            account._saved_holdings = {symbol: (quantity, None) for symbol, quantity in account.holdings.items()}
+        if stale or stale_lots:
+            account._saved_fields = {}
+        if stale_lots:
+            # Likewise for lots, which are written back in full with the next save
+            account._lots.dirty = account._lots.lots.keys() | account._lots.realized.keys()
+        if VERIFY_PNL:
+            account.verify_cost_basis()
+        return account
+
+    def reload(self):
+        """ Replace this object's state with what is currently in the database. """
+        latest = type(self).get(self.name)
+        for field in type(self).model_fields:
+            setattr(self, field, getattr(latest, field))
+        self._lots = latest._lots
+        # Keep whatever get() marked to be written back, such as lots rebuilt for a legacy account
+        dirty_lots = set(latest._lots.dirty)
+        self._mark_saved(latest._version)
+        self._saved_fields = latest._saved_fields
+        self._saved_holdings = latest._saved_holdings
+        self._lots.dirty = dirty_lots
+
+    def _fields(self) -> dict:
+        return {field: getattr(self, field) for field in ACCOUNT_FIELDS}
+
+    def _positions(self) -> dict[str, tuple[int, float]]:
+        return {symbol: (quantity, self.cost_basis.get(symbol, 0.0)) for symbol, quantity in self.holdings.items()}
+
+    def _mark_saved(self, version: int):
+        """ Remember what is in the database, so the next save only writes what changed. """
+        self._version = version
+        self._saved_fields = self._fields()
+        self._saved_holdings = self._positions()
+        self._saved_transactions = len(self.transactions)
+        self._saved_values = len(self.portfolio_value_time_series)
+        self._lots.mark_saved()
+
+    def pending_values(self) -> list[tuple[str, float]]:
+        """ The portfolio values recorded since the account was last written. """
+        return self.portfolio_value_time_series[self._saved_values:]
+
     def save(self):
-        write_account(self.name.lower(), self.model_dump())
+        """
+        Write any changes, or hand them to the write-behind cache if it owns this account. Only
+        recording a portfolio value saves this way; anything a caller is told has happened, such
+        as a trade, is written with flush() before returning.
+        """
+        if self._write_behind is not None:
+            self._write_behind(self.name)
+        else:
+            self.flush()
+
+    @retry_on_conflict
+    def flush_deferred(self):
+        """ Write the changes save() deferred, recording them again on the latest state if another process saved meanwhile. """
+        self.flush()
 
+    def flush(self):
+        """ Write any changes to the database now. """
+        if len(self.transactions) < self._saved_transactions or len(self.portfolio_value_time_series) < self._saved_values:
+            account_dict = {
+                **self.model_dump(),
+                "lots": {symbol: self._lots.open_lots(symbol) for symbol in self._lots.lots},
+                "lot_realized_pnl": dict(self._lots.realized),
+            }
+            version = write_account(self.name.lower(), account_dict, expected_version=self._version)
+        else:
+            positions = self._positions()
+            holdings = {
+                symbol: positions.get(symbol, (0, 0.0))
+                for symbol in positions.keys() | self._saved_holdings.keys()
+                if positions.get(symbol) != self._saved_holdings.get(symbol)
+            }
+            transactions = self.transactions.to_dicts(self._saved_transactions)
+            values = self.portfolio_value_time_series[self._saved_values:]
+            lots = self._lots.changes()
+            fields = self._fields()
+            if fields == self._saved_fields and not holdings and not transactions and not values and not lots:
+                return
+            version = update_account(self.name, self._version, fields, holdings, transactions, values, lots)
+        self._mark_saved(version)
+
+    def _record(self, transaction: Transaction, lot_ids: list[int] | None = None):
+        """ Append a transaction, updating holdings, lots, cost basis and running P&L without any replay. """
+        symbol = transaction.symbol
+        # The transaction's position in the ledger identifies the lot a buy opens
+        self._lots.record(len(self.transactions), transaction, self.lot_method, lot_ids)
+        held = self.holdings.get(symbol, 0)
+        self.realized_pnl += apply_to_cost_basis(self.cost_basis, held, transaction)
+        self.net_spend += transaction.total()
+        self.holdings[symbol] = held + transaction.quantity
+        # If shares are completely sold, remove from holdings
+        if self.holdings[symbol] == 0:
+            del self.holdings[symbol]
+        self.transactions.append(transaction)
+        if VERIFY_PNL:
+            self.verify_cost_basis()
+
+    def _record_value(self, timestamp: str, value: float):
+        """ Append a portfolio value, keeping only the last day in memory; storage keeps the rollups. """
+        series = self.portfolio_value_time_series
+        series.append((timestamp, value))
+        expired = value_series.expire(series, value_series.cutoffs(timestamp)[value_series.RAW])
+        self._saved_values = max(0, self._saved_values - expired)
+
+    def verify_cost_basis(self):
+        """ Cross-check the running cost basis and P&L against a full replay of the transactions. """
+        cost_basis, net_spend, realized_pnl = replay_cost_basis(self.transactions)
+        close = lambda a, b: math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+        symbols = cost_basis.keys() | self.cost_basis.keys()
+        if (
+            not close(net_spend, self.net_spend)
+            or not close(realized_pnl, self.realized_pnl)
+            or not all(close(cost_basis.get(s, 0.0), self.cost_basis.get(s, 0.0)) for s in symbols)
+        ):
+            raise ValueError(
+                f"Running P&L for {self.name} disagrees with a full replay: "
+                f"net spend {self.net_spend} vs {net_spend}, realized {self.realized_pnl} vs {realized_pnl}, "
+                f"cost basis {self.cost_basis} vs {cost_basis}"
+            )
+        lot_holdings = {symbol: values["quantity"] for symbol, values in self._lots.pnl({}).items() if values["quantity"]}
+        if lot_holdings != self.holdings:
+            raise ValueError(f"Open lots for {self.name} hold {lot_holdings}, but the holdings are {self.holdings}")
+
+    @retry_on_conflict
     def reset(self, strategy: str):
         self.balance = INITIAL_BALANCE
         self.strategy = strategy
         self.holdings = {}
-        self.transactions = []
+        self.transactions = Ledger()
         self.portfolio_value_time_series = []
-        self.save()
+        self.cost_basis = {}
+        self.net_spend = 0.0
+        self.realized_pnl = 0.0
+        self._lots = LotBook()
+        self.flush()
 
+    @retry_on_conflict
     def deposit(self, amount: float):
         """ Deposit funds into the account. """
         if amount <= 0:
             raise ValueError("Deposit amount must be positive.")
         self.balance += amount
         print(f"Deposited ${amount}. New balance: ${self.balance}")
-        self.save()
+        self.flush()
 
+    @retry_on_conflict
     def withdraw(self, amount: float):
         """ Withdraw funds from the account, ensuring it doesn't go negative. """
         if amount > self.balance:
             raise ValueError("Insufficient funds for withdrawal.")
         self.balance -= amount
         print(f"Withdrew ${amount}. New balance: ${self.balance}")
-        self.save()
+        self.flush()
 
+    @retry_on_conflict
     def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
         """ Buy shares of a stock if sufficient funds are available. """
-        price = get_share_price(symbol)
+        # Price the rest of the holdings in the same lookup, for the details returned
+        prices = get_share_prices([symbol, *self.holdings])
+        price = prices.get(symbol, 0)
         buy_price = price * (1 + SPREAD)
         total_cost = buy_price * quantity
         
@@ -87,56 +312,48 @@ class Account(BaseModel):
         elif price==0:
             raise ValueError(f"Unrecognized symbol {symbol}")
         
-        # Update holdings
-        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
+        timestamp = clock.timestamp()
+        # Record transaction and update holdings
         transaction = Transaction(symbol=symbol, quantity=quantity, price=buy_price, timestamp=timestamp, rationale=rationale)
-        self.transactions.append(transaction)
+        self._record(transaction)
         
         # Update balance
         self.balance -= total_cost
-        self.save()
+        self.flush()
         write_log(self.name, "account", f"Bought {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+        return "Completed. Latest details:\n" + json.dumps(self._summary(prices, 1))
 
-    def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
-        """ Sell shares of a stock if the user has enough shares. """
+    @retry_on_conflict
+    def sell_shares(self, symbol: str, quantity: int, rationale: str, lot_ids: list[int] | None = None) -> str:
+        """ Sell shares of a stock if the user has enough shares, from the given lots or by the account's lot method. """
         if self.holdings.get(symbol, 0) < quantity:
             raise ValueError(f"Cannot sell {quantity} shares of {symbol}. Not enough shares held.")
+        self._lots.check_sell(symbol, quantity, self.lot_method, lot_ids)
         
-        price = get_share_price(symbol)
+        prices = get_share_prices(list(self.holdings))
+        price = prices.get(symbol, 0)
         sell_price = price * (1 - SPREAD)
         total_proceeds = sell_price * quantity
         
-        # Update holdings
-        self.holdings[symbol] -= quantity
-        
-        # If shares are completely sold, remove from holdings
-        if self.holdings[symbol] == 0:
-            del self.holdings[symbol]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
+        timestamp = clock.timestamp()
+        # Record transaction and update holdings
         transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)  # negative quantity for sell
-        self.transactions.append(transaction)
+        self._record(transaction, lot_ids)
 
         # Update balance
         self.balance += total_proceeds
-        self.save()
+        self.flush()
         write_log(self.name, "account", f"Sold {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+        return "Completed. Latest details:\n" + json.dumps(self._summary(prices, 1))
 
     def calculate_portfolio_value(self):
         """ Calculate the total value of the user's portfolio. """
-        total_value = self.balance
-        for symbol, quantity in self.holdings.items():
-            total_value += get_share_price(symbol) * quantity
-        return total_value
+        prices = get_share_prices(list(self.holdings))
+        return self.balance + sum(prices[symbol] * quantity for symbol, quantity in self.holdings.items())
 
     def calculate_profit_loss(self, portfolio_value: float):
         """ Calculate profit or loss from the initial spend. """
-        initial_spend = sum(transaction.total() for transaction in self.transactions)
-        return portfolio_value - initial_spend - self.balance
+        return portfolio_value - self.net_spend - self.balance
 
     def get_holdings(self):
         """ Report the current holdings of the user. """
@@ -148,12 +365,82 @@ class Account(BaseModel):
 
     def list_transactions(self):
         """ List all transactions made by the user. """
-        return [transaction.model_dump() for transaction in self.transactions]
+        return self.transactions.to_dicts()
     
+    @retry_on_conflict
+    def execute_orders(self, orders: list[Order]) -> str:
+        """ Execute a batch of orders in sequence at one snapshot of prices, all of them or none. """
+        if not orders:
+            raise ValueError("No orders to execute.")
+        prices = get_share_prices(list({order.symbol for order in orders} | self.holdings.keys()))
+        timestamp = clock.timestamp()
+        # Check the whole batch against the running balance and holdings before changing anything
+        balance, holdings, transactions = self.balance, dict(self.holdings), []
+        lots = self._lots.subset({order.symbol for order in orders})
+        for order in orders:
+            price = prices.get(order.symbol, 0)
+            if order.quantity <= 0:
+                raise ValueError(f"Cannot {order.side} {order.quantity} shares of {order.symbol}.")
+            elif price == 0:
+                raise ValueError(f"Unrecognized symbol {order.symbol}")
+            if order.side == "buy":
+                fill_price = price * (1 + SPREAD)
+                if fill_price * order.quantity > balance:
+                    raise ValueError(f"Insufficient funds to buy {order.quantity} shares of {order.symbol}.")
+                # A later sale in the batch may close the lot this opens
+                lots.buy(len(self.transactions) + len(transactions), order.symbol, order.quantity, fill_price, timestamp)
+                quantity = order.quantity
+            else:
+                if holdings.get(order.symbol, 0) < order.quantity:
+                    raise ValueError(f"Cannot sell {order.quantity} shares of {order.symbol}. Not enough shares held.")
+                fill_price = price * (1 - SPREAD)
+                lots.sell(order.symbol, order.quantity, fill_price, self.lot_method, order.lot_ids)
+                quantity = -order.quantity
+            balance -= fill_price * quantity
+            holdings[order.symbol] = holdings.get(order.symbol, 0) + quantity
+            transactions.append(Transaction(
+                symbol=order.symbol, quantity=quantity, price=fill_price, timestamp=timestamp, rationale=order.rationale
+            ))
+
+        for order, transaction in zip(orders, transactions):
+            self._record(transaction, order.lot_ids)
+        self.balance = balance
+        portfolio_value = self.balance + sum(prices.get(symbol, 0) * quantity for symbol, quantity in self.holdings.items())
+        self._record_value(timestamp, portfolio_value)
+        self.flush()
+        write_log(self.name, "account", f"Executed {len(transactions)} orders")
+        return json.dumps({
+            "executed": [
+                {"symbol": t.symbol, "quantity": t.quantity, "price": round(t.price, 4)} for t in transactions
+            ],
+            "balance": self.balance,
+            "holdings": self.holdings,
+            "total_portfolio_value": portfolio_value,
+            "total_profit_loss": self.calculate_profit_loss(portfolio_value),
+        })
+
+    def get_lots(self, symbol: str) -> list[dict]:
+        """ List the open lots of a symbol, oldest first. """
+        return [
+            {"lot_id": lot_id, "quantity": quantity, "price": price, "timestamp": timestamp}
+            for lot_id, quantity, price, timestamp in self._lots.open_lots(symbol)
+        ]
+
+    def get_profit_loss_by_symbol(self) -> dict[str, dict]:
+        """ Report realized and unrealized profit or loss per symbol, from the lots. """
+        prices = get_share_prices(list(self._lots.lots))
+        return self._lots.pnl(prices)
+
+    def record_portfolio_value(self) -> float:
+        """ Value the portfolio at current prices and add the value to its time series, without saving. """
+        portfolio_value = self.calculate_portfolio_value()
+        self._record_value(clock.timestamp(), portfolio_value)
+        return portfolio_value
+
+    @retry_on_conflict
     def report(self) -> str:
         """ Return a json string representing the account.  """
-        portfolio_value = self.calculate_portfolio_value()
-        self.portfolio_value_time_series.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value))
+        portfolio_value = self.record_portfolio_value()
         self.save()
         pnl = self.calculate_profit_loss(portfolio_value)
         data = self.model_dump()
@@ -162,15 +449,49 @@ class Account(BaseModel):
         write_log(self.name, "account", f"Retrieved account details")
         return json.dumps(data)
     
+    @retry_on_conflict
+    def summary(self, last_n: int = SUMMARY_TRANSACTIONS) -> str:
+        """ Return a compact json summary of the account: holdings with value and weight, the latest transactions and totals. """
+        summary = self._summary(get_share_prices(list(self.holdings)), last_n)
+        self._record_value(clock.timestamp(), summary["total_portfolio_value"])
+        self.save()
+        write_log(self.name, "account", f"Retrieved account summary")
+        return json.dumps(summary)
+
+    def _summary(self, prices: dict[str, float], last_n: int) -> dict:
+        """ Build the summary from the account as it is in memory, valued at prices, without recording or saving anything. """
+        values = {symbol: prices.get(symbol, 0) * quantity for symbol, quantity in self.holdings.items()}
+        portfolio_value = self.balance + sum(values.values())
+        return {
+            "name": self.name,
+            "balance": self.balance,
+            "holdings": [
+                {
+                    "symbol": symbol,
+                    "quantity": quantity,
+                    "price": prices.get(symbol, 0),
+                    "value": values[symbol],
+                    "weight": round(values[symbol] / portfolio_value, 4) if portfolio_value else 0.0,
+                }
+                for symbol, quantity in sorted(self.holdings.items(), key=lambda item: -values[item[0]])
+            ],
+            "transaction_count": len(self.transactions),
+            "recent_transactions": self.transactions.to_dicts(max(0, len(self.transactions) - max(0, last_n))),
+            "realized_pnl": self.realized_pnl,
+            "total_portfolio_value": portfolio_value,
+            "total_profit_loss": self.calculate_profit_loss(portfolio_value),
+        }
+
     def get_strategy(self) -> str:
         """ Return the strategy of the account """
         write_log(self.name, "account", f"Retrieved strategy")
         return self.strategy
     
+    @retry_on_conflict
     def change_strategy(self, strategy: str) -> str:
         """ At your discretion, if you choose to, call this to change your investment strategy for the future """
         self.strategy = strategy
-        self.save()
+        self.flush()
         write_log(self.name, "account", f"Changed strategy")
         return "Changed strategy"
 
@@ -28,6 +28,13 @@ async def read_accounts_resource(name):
             result = await session.read_resource(f"accounts://accounts_server/{name}")
             return result.contents[0].text
         
+async def read_summary_resource(name, last_n=10):
+    async with stdio_client(params) as streams:
+        async with mcp.ClientSession(*streams) as session:
+            await session.initialize()
+            result = await session.read_resource(f"accounts://summary/{name}/{last_n}")
+            return result.contents[0].text
+
 async def read_strategy_resource(name):
     async with stdio_client(params) as streams:
         async with mcp.ClientSession(*streams) as session:
@@ -35,6 +42,16 @@ async def read_strategy_resource(name):
             result = await session.read_resource(f"accounts://strategy/{name}")
             return result.contents[0].text
 
+def is_strict_compatible(schema: dict) -> bool:
+    """
+    Whether OpenAI's strict mode accepts the schema as it stands: every property required, and no
+    nested object types, which would each need closing too. Optional arguments, such as sell_shares'
+    lot_ids, and lists of objects, such as execute_orders' orders, are neither.
+    """
+    properties = schema.get("properties", {})
+    return set(properties) == set(schema.get("required", [])) and "$defs" not in schema
+
+
 async def get_accounts_tools_openai():
     openai_tools = []
     for tool in await list_accounts_tools():
@@ -43,8 +60,8 @@ async def get_accounts_tools_openai():
             name=tool.name,
             description=tool.description,
             params_json_schema=schema,
-            on_invoke_tool=lambda ctx, args, toolname=tool.name: call_accounts_tool(toolname, json.loads(args))
-                
+            on_invoke_tool=lambda ctx, args, toolname=tool.name: call_accounts_tool(toolname, json.loads(args)),
+            strict_json_schema=is_strict_compatible(schema),
         )
         openai_tools.append(openai_tool)
     return openai_tools
\ No newline at end of file
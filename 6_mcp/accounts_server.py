@@ -1,5 +1,8 @@
+import json
 from mcp.server.fastmcp import FastMCP
-from accounts import Account
+from account_cache import account_cache
+from accounts import Order
+from async_database import run_blocking
 
 mcp = FastMCP("accounts_server")
 
@@ -10,7 +13,7 @@ async def get_balance(name: str) -> float:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).balance
+    return await run_blocking(account_cache.use, name, lambda account: account.balance)
 
 @mcp.tool()
 async def get_holdings(name: str) -> dict[str, int]:
@@ -19,7 +22,7 @@ async def get_holdings(name: str) -> dict[str, int]:
     Args:
         name: The name of the account holder
     """
-    return Account.get(name).holdings
+    return await run_blocking(account_cache.use, name, lambda account: dict(account.holdings))
 
 @mcp.tool()
 async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
@@ -31,11 +34,11 @@ async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> f
         quantity: The quantity of shares to buy
         rationale: The rationale for the purchase and fit with the account's strategy
     """
-    return Account.get(name).buy_shares(symbol, quantity, rationale)
+    return await run_blocking(account_cache.use, name, lambda account: account.buy_shares(symbol, quantity, rationale))
 
 
 @mcp.tool()
-async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
+async def sell_shares(name: str, symbol: str, quantity: int, rationale: str, lot_ids: list[int] | None = None) -> float:
     """Sell shares of a stock.
 
     Args:
@@ -43,8 +46,43 @@ async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) ->
         symbol: The symbol of the stock
         quantity: The quantity of shares to sell
         rationale: The rationale for the sale and fit with the account's strategy
+        lot_ids: Optionally, the ids of the lots to sell from, in order; otherwise the account's lot method chooses
     """
-    return Account.get(name).sell_shares(symbol, quantity, rationale)
+    return await run_blocking(account_cache.use, name, lambda account: account.sell_shares(symbol, quantity, rationale, lot_ids))
+
+@mcp.tool()
+async def get_lots(name: str, symbol: str) -> list[dict]:
+    """Get the open lots of a stock held in the given account, oldest first.
+
+    Args:
+        name: The name of the account holder
+        symbol: The symbol of the stock
+    """
+    return await run_blocking(account_cache.use, name, lambda account: account.get_lots(symbol))
+
+@mcp.tool()
+async def get_profit_loss_by_symbol(name: str) -> dict[str, dict]:
+    """Get the realized and unrealized profit or loss of each stock in the given account, from its lots.
+
+    Args:
+        name: The name of the account holder
+    """
+    return await run_blocking(account_cache.use, name, lambda account: account.get_profit_loss_by_symbol())
+
+@mcp.tool()
+async def execute_orders(name: str, orders: list[Order]) -> str:
+    """Buy and sell several stocks in one go, such as when rebalancing.
+
+    The orders are executed in sequence at one snapshot of prices, and either all of them go
+    through or, if any of them can't, none do. Returns a compact summary of the fills and the account.
+
+    Args:
+        name: The name of the account holder
+        orders: The orders, each with a symbol, a side of "buy" or "sell", a positive quantity of shares,
+            the rationale for the trade and fit with the account's strategy, and optionally for a sale the
+            ids of the lots to sell from
+    """
+    return await run_blocking(account_cache.use, name, lambda account: account.execute_orders(orders))
 
 @mcp.tool()
 async def change_strategy(name: str, strategy: str) -> str:
@@ -54,17 +92,23 @@ async def change_strategy(name: str, strategy: str) -> str:
         name: The name of the account holder
         strategy: The new strategy for the account
     """
-    return Account.get(name).change_strategy(strategy)
+    return await run_blocking(account_cache.use, name, lambda account: account.change_strategy(strategy))
 
 @mcp.resource("accounts://accounts_server/{name}")
 async def read_account_resource(name: str) -> str:
-    account = Account.get(name.lower())
-    return account.report()
+    return await run_blocking(account_cache.use, name.lower(), lambda account: account.report())
+
+@mcp.resource("accounts://summary/{name}/{last_n}")
+async def read_summary_resource(name: str, last_n: str) -> str:
+    return await run_blocking(account_cache.use, name.lower(), lambda account: account.summary(int(last_n)))
 
 @mcp.resource("accounts://strategy/{name}")
 async def read_strategy_resource(name: str) -> str:
-    account = Account.get(name.lower())
-    return account.get_strategy()
+    return await run_blocking(account_cache.use, name.lower(), lambda account: account.get_strategy())
+
+@mcp.resource("accounts://cache_stats")
+async def read_cache_stats_resource() -> str:
+    return json.dumps(account_cache.stats())
 
 if __name__ == "__main__":
     mcp.run(transport='stdio')
\ No newline at end of file
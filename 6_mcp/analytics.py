@@ -0,0 +1,112 @@
+"""
+Portfolio analytics for the traders' accounts, vectorised with NumPy and pandas.
+
+Each account is analysed in one pass over its portfolio value history and its ledger's
+columns, so comparing traders stays cheap however long the history gets. Run from this
+directory to print a comparison, for example:
+
+    uv run analytics.py
+    uv run analytics.py Warren George --output analytics.csv
+"""
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from accounts import Account
+from database import read_portfolio_values
+from ledger import Ledger
+from market import get_share_prices
+from value_series import RAW, HOURLY, DAILY
+
+load_dotenv(override=True)
+
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0.0"))
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+# The fewest points a resolution needs before it's used for returns
+MIN_POINTS = 3
+
+COLUMNS = [
+    "total_return", "volatility", "max_drawdown", "sharpe", "sortino", "turnover", "exposure", "points", "resolution",
+]
+
+
+def value_history(name: str) -> tuple[pd.Series, str]:
+    """ The account's portfolio value history at the coarsest resolution with enough points, and that resolution. """
+    for resolution in (DAILY, HOURLY, RAW):
+        points = read_portfolio_values(name, resolution)
+        if len(points) >= MIN_POINTS:
+            break
+    closes = np.array([point[4] for point in points], dtype=float)
+    return pd.Series(closes, index=pd.to_datetime([point[0] for point in points])), resolution
+
+
+def analyze(values: pd.Series, ledger: Ledger, exposure: float) -> dict:
+    """
+    Compute the account's performance over its value history in one vectorised pass.
+
+    Returns are taken between successive points and annualised by how many points there are per
+    year of history, so irregular reporting still gives comparable figures. Turnover is the value
+    traded over the window divided by the average portfolio value.
+    """
+    stats = dict.fromkeys(COLUMNS, np.nan)
+    stats["points"] = len(values)
+    stats["exposure"] = exposure
+    if len(values) < 2:
+        return stats
+    closes = values.to_numpy()
+    seconds = values.index.as_unit("s").asi8
+    returns = closes[1:] / closes[:-1] - 1
+    years = (seconds[-1] - seconds[0]) / SECONDS_PER_YEAR
+    periods_per_year = len(returns) / years if years > 0 else np.nan
+    excess = returns - RISK_FREE_RATE / periods_per_year
+    deviation = returns.std(ddof=1) if len(returns) > 1 else np.nan
+    downside = np.sqrt(np.mean(np.minimum(excess, 0) ** 2))
+    window = np.frombuffer(ledger.epochs, dtype=np.int64) >= seconds[0]
+    quantities = np.frombuffer(ledger.quantities, dtype=np.int64)[window]
+    traded = np.abs(quantities * np.frombuffer(ledger.prices, dtype=np.float64)[window]).sum()
+    stats.update(
+        total_return=closes[-1] / closes[0] - 1,
+        volatility=deviation * np.sqrt(periods_per_year),
+        max_drawdown=(closes / np.maximum.accumulate(closes) - 1).min(),
+        sharpe=excess.mean() / deviation * np.sqrt(periods_per_year) if deviation else np.nan,
+        sortino=excess.mean() / downside * np.sqrt(periods_per_year) if downside else np.nan,
+        turnover=traded / closes.mean(),
+    )
+    return stats
+
+
+def analyze_account(account: Account) -> dict:
+    values, resolution = value_history(account.name)
+    prices = get_share_prices(list(account.holdings))
+    invested = sum(prices.get(symbol, 0) * quantity for symbol, quantity in account.holdings.items())
+    total = account.balance + invested
+    stats = analyze(values, account.transactions, invested / total if total else np.nan)
+    stats["resolution"] = resolution
+    return stats
+
+
+def compare(names: list[str]) -> pd.DataFrame:
+    """ One row of analytics per account, for comparing traders side by side. """
+    return pd.DataFrame([analyze_account(Account.get(name)) for name in names], index=names, columns=COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help="accounts to compare; defaults to the traders on the floor")
+    parser.add_argument("--output", help="also write the comparison to this CSV file")
+    args = parser.parse_args()
+    if not args.names:
+        from trading_floor import names
+        args.names = names
+    comparison = compare(args.names)
+    with pd.option_context("display.float_format", "{:,.4f}".format, "display.width", 160):
+        print(comparison)
+    if args.output:
+        comparison.to_csv(args.output)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 import gradio as gr
+import os
+from collections import deque
+from datetime import datetime, timedelta
 from util import css, js, Color
 import pandas as pd
 from trading_floor import names, lastnames, short_model_names
 import plotly.express as px
 from accounts import Account
-from database import read_log
+from analytics import analyze_account
+from database import read_log_since, read_portfolio_values
+from value_series import DAILY, TIME_FORMAT, resolution_for
 
 mapper = {
     "trace": Color.WHITE,
@@ -15,6 +20,10 @@ mapper = {
     "account": Color.RED,
 }
 
+LOG_LINES = 13
+# How many days the portfolio value chart shows; 0 shows the whole history
+CHART_DAYS = int(os.getenv("CHART_DAYS", "0"))
+
 
 class Trader:
     def __init__(self, name: str, lastname: str, model_name: str):
@@ -22,6 +31,9 @@ class Trader:
         self.lastname = lastname
         self.model_name = model_name
         self.account = Account.get(name)
+        self.log_cursor = 0
+        self.log_lines = deque(maxlen=LOG_LINES)
+        self.log_html = self.render_logs()
 
     def reload(self):
         self.account = Account.get(self.name)
@@ -33,7 +45,16 @@ class Trader:
         return self.account.get_strategy()
 
     def get_portfolio_value_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(self.account.portfolio_value_time_series, columns=["datetime", "value"])
+        """Read the portfolio value over the visible window, at the finest resolution that covers it"""
+        now = datetime.now()
+        if CHART_DAYS:
+            since = (now - timedelta(days=CHART_DAYS)).strftime(TIME_FORMAT)
+        else:
+            first = read_portfolio_values(self.name, DAILY)[:1]
+            since = first[0][0] if first else now.strftime(TIME_FORMAT)
+        resolution = resolution_for(since, now.strftime(TIME_FORMAT))
+        points = read_portfolio_values(self.name, resolution, since)
+        df = pd.DataFrame(points, columns=["datetime", "open", "high", "low", "value"])
         df["datetime"] = pd.to_datetime(df["datetime"])
         return df
 
@@ -80,16 +101,34 @@ class Trader:
         emoji = "⬆" if pnl >= 0 else "⬇"
         return f"<div style='text-align: center;background-color:{color};'><span style='font-size:32px'>${portfolio_value:,.0f}</span><span style='font-size:24px'>&nbsp;&nbsp;&nbsp;{emoji}&nbsp;${pnl:,.0f}</span></div>"
 
+    def get_analytics(self) -> str:
+        """Summarise the account's risk and return figures in one line"""
+        stats = analyze_account(self.account)
+        figures = [
+            ("Return", stats["total_return"], "{:+.1%}"),
+            ("Volatility", stats["volatility"], "{:.1%}"),
+            ("Drawdown", stats["max_drawdown"], "{:.1%}"),
+            ("Sharpe", stats["sharpe"], "{:.2f}"),
+            ("Sortino", stats["sortino"], "{:.2f}"),
+            ("Turnover", stats["turnover"], "{:.1f}x"),
+            ("Exposure", stats["exposure"], "{:.0%}"),
+        ]
+        cells = [f"{label} {'-' if pd.isna(value) else format.format(value)}" for label, value, format in figures]
+        return f"<div style='text-align: center;font-size:14px;'>{'&nbsp;&nbsp;|&nbsp;&nbsp;'.join(cells)}</div>"
+
+    def render_logs(self) -> str:
+        return f"<div style='height:250px; overflow-y:auto;'>{''.join(self.log_lines)}</div>"
+
     def get_logs(self, previous=None) -> str:
-        logs = read_log(self.name, last_n=13)
-        response = ""
+        logs = read_log_since(self.name, self.log_cursor, last_n=LOG_LINES)
         for log in logs:
-            timestamp, type, message = log
+            self.log_cursor, timestamp, type, message = log
             color = mapper.get(type, Color.WHITE).value
-            response += f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
-        response = f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
-        if response != previous:
-            return response
+            self.log_lines.append(f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>")
+        if logs:
+            self.log_html = self.render_logs()
+        if self.log_html != previous:
+            return self.log_html
         return gr.update()
 
 
@@ -97,6 +136,7 @@ class TraderView:
     def __init__(self, trader: Trader):
         self.trader = trader
         self.portfolio_value = None
+        self.analytics = None
         self.chart = None
         self.holdings_table = None
         self.transactions_table = None
@@ -106,6 +146,8 @@ class TraderView:
             gr.HTML(self.trader.get_title())
             with gr.Row():
                 self.portfolio_value = gr.HTML(self.trader.get_portfolio_value)
+            with gr.Row():
+                self.analytics = gr.HTML(self.trader.get_analytics)
             with gr.Row():
                 self.chart = gr.Plot(
                     self.trader.get_portfolio_value_chart, container=True, show_label=False
@@ -139,6 +181,7 @@ class TraderView:
             inputs=[],
             outputs=[
                 self.portfolio_value,
+                self.analytics,
                 self.chart,
                 self.holdings_table,
                 self.transactions_table,
@@ -159,6 +202,7 @@ class TraderView:
         self.trader.reload()
         return (
             self.trader.get_portfolio_value(),
+            self.trader.get_analytics(),
             self.trader.get_portfolio_value_chart(),
             self.trader.get_holdings_df(),
             self.trader.get_transactions_df(),
@@ -0,0 +1,20 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+DB_IO_THREADS = int(os.getenv("DB_IO_THREADS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_IO_THREADS, thread_name_prefix="db-io")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Run a blocking call on the I/O thread pool and await its result.
+
+    Each pool thread keeps its own database connection, so several calls can be in flight
+    at once while the event loop stays free to serve other requests.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
@@ -0,0 +1,221 @@
+"""
+Replay stored closing prices through Account to evaluate rule-based trading policies offline.
+
+A backtest reads the price history from the prices table, then steps through it one trading day at a
+time on a simulated clock. Each day the policy looks at the account and that day's closes and returns
+orders, which the account executes exactly as it would for a trader, so the same accounting, lots and
+P&L code is exercised with no model or network calls. The account lives in a throwaway in-memory
+store, so a backtest never touches the real accounts. Run from this directory, for example:
+
+    uv run backtest.py AAPL MSFT NVDA --policy equal_weight --start 2024-01-01
+    uv run backtest.py AAPL MSFT NVDA --policy random --seed 7 --runs 20
+"""
+
+import argparse
+import math
+import random
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+import clock
+import database
+import market
+from accounts import Account, Order, SPREAD
+from analytics import analyze, value_history
+from lots import LOT_METHOD, LOT_METHODS
+from market_provider import MarketProvider
+
+# Trades are stamped at the close of the day they're replayed on
+MARKET_CLOSE = timedelta(hours=16)
+
+Policy = Callable[[Account, dict[str, float], int], list[Order]]
+
+
+class ReplayMarket(MarketProvider):
+    """
+    The stored closes of a set of symbols, loaded once and served as of the day being replayed.
+
+    A symbol with no close on a day keeps its last known price, as it would on a quiet day in the market.
+    """
+
+    def __init__(self, symbols: list[str], start: str | None = None, end: str | None = None):
+        self.symbols = list(dict.fromkeys(symbols))
+        # Only the days on which at least one of the symbols has a close
+        days = [(date, database.read_prices(date, self.symbols)) for date in database.read_price_dates(start, end)]
+        days = [(date, closes) for date, closes in days if closes]
+        self.dates = [date for date, _ in days]
+        self.history = [closes for _, closes in days]
+        self.prices: dict[str, float] = {}
+
+    def advance(self, step: int) -> dict[str, float]:
+        """ Move on to the step'th day, returning the prices as of that day's close. """
+        self.prices.update(self.history[step])
+        return self.prices
+
+    def get_share_prices(self, symbols: list[str]) -> dict[str, float]:
+        return {symbol: self.prices.get(symbol, 0.0) for symbol in symbols}
+
+
+def equal_weight(account: Account, prices: dict[str, float], step: int) -> list[Order]:
+    """ Rebalance into equal weights of every priced symbol, selling before buying so the sales fund the buys. """
+    priced = [symbol for symbol in sorted(prices) if prices[symbol] > 0]
+    if not priced:
+        return []
+    value = account.balance + sum(prices.get(symbol, 0) * quantity for symbol, quantity in account.holdings.items())
+    # Leave room for the spread, so the buys never run out of cash
+    target = value * (1 - 2 * SPREAD) / len(priced)
+    sells, buys = [], []
+    for symbol in priced:
+        change = math.floor(target / prices[symbol]) - account.holdings.get(symbol, 0)
+        if change < 0:
+            sells.append(Order(symbol=symbol, side="sell", quantity=-change, rationale="Rebalance to equal weight"))
+        elif change > 0:
+            buys.append(Order(symbol=symbol, side="buy", quantity=change, rationale="Rebalance to equal weight"))
+    return sells + buys
+
+
+def buy_and_hold(account: Account, prices: dict[str, float], step: int) -> list[Order]:
+    """ Buy equal weights on the first day and hold them throughout. """
+    return equal_weight(account, prices, step) if step == 0 else []
+
+
+def random_trades(seed: int = 0, trades_per_day: int = 5) -> Policy:
+    """
+    A policy of random buys and sales, half of the sales naming random lots, for exercising the
+    accounting at scale; the same seed gives the same trades.
+    """
+    rng = random.Random(seed)
+
+    def policy(account: Account, prices: dict[str, float], step: int) -> list[Order]:
+        if not prices:
+            return []
+        balance, holdings, orders = account.balance, dict(account.holdings), []
+        # The account's lots only match the holdings of symbols this batch hasn't traded yet
+        traded = set()
+        for _ in range(trades_per_day):
+            symbol = rng.choice(sorted(prices))
+            price = prices[symbol]
+            if holdings.get(symbol) and rng.random() < 0.5:
+                quantity = rng.randint(1, holdings[symbol])
+                lot_ids = None
+                if symbol not in traded and rng.random() < 0.5:
+                    lots = account.get_lots(symbol)
+                    rng.shuffle(lots)
+                    lot_ids, covered = [], 0
+                    for lot in lots:
+                        if covered >= quantity:
+                            break
+                        lot_ids.append(lot["lot_id"])
+                        covered += lot["quantity"]
+                orders.append(Order(symbol=symbol, side="sell", quantity=quantity, rationale="Random sale", lot_ids=lot_ids))
+                holdings[symbol] -= quantity
+                balance += quantity * price * (1 - SPREAD)
+                traded.add(symbol)
+            else:
+                affordable = math.floor(balance / (price * (1 + SPREAD))) if price > 0 else 0
+                if affordable < 1:
+                    continue
+                quantity = rng.randint(1, min(affordable, 100))
+                orders.append(Order(symbol=symbol, side="buy", quantity=quantity, rationale="Random buy"))
+                holdings[symbol] = holdings.get(symbol, 0) + quantity
+                balance -= quantity * price * (1 + SPREAD)
+                traded.add(symbol)
+        return orders
+
+    return policy
+
+
+POLICIES = {
+    "equal_weight": lambda seed: equal_weight,
+    "buy_and_hold": lambda seed: buy_and_hold,
+    "random": lambda seed: random_trades(seed),
+}
+
+
+def run_backtest(
+    replay: ReplayMarket, policy: Policy, name: str = "backtest", lot_method: str = LOT_METHOD, verify: bool = True
+) -> dict:
+    """
+    Run policy over every day of replay on a fresh account, and return its analytics along with the
+    number of trades, rejected batches and the simulated trading rate.
+
+    The account is kept in a new in-memory store, and the clock and prices are put back afterwards.
+    With verify, the account's running P&L and lots are cross-checked against its ledger at the end.
+    """
+    if not replay.dates:
+        raise ValueError("No stored prices of these symbols to replay; load some history into the prices table first.")
+    previous_storage, previous_provider = database.storage, market.provider
+    simulated = clock.SimulatedClock(datetime.fromisoformat(replay.dates[0]) + MARKET_CLOSE)
+    database.use_storage(database.create_storage("memory"))
+    clock.use_clock(simulated)
+    market.use_provider(replay)
+    try:
+        account = Account.get(name)
+        account.lot_method = lot_method
+        replay.prices.clear()
+        trades, rejected = 0, 0
+        started = time.perf_counter()
+        for step, date in enumerate(replay.dates):
+            simulated.set(datetime.fromisoformat(date) + MARKET_CLOSE)
+            prices = replay.advance(step)
+            orders = policy(account, dict(prices), step)
+            if orders:
+                try:
+                    # Executing the orders also records the day's portfolio value
+                    account.execute_orders(orders)
+                    trades += len(orders)
+                    continue
+                except ValueError as e:
+                    print(f"{date}: orders rejected: {e}")
+                    rejected += 1
+            account.record_portfolio_value()
+            account.save()
+        elapsed = time.perf_counter() - started
+        if verify:
+            account.verify_cost_basis()
+        values, resolution = value_history(account.name)
+        invested = sum(prices.get(symbol, 0) * quantity for symbol, quantity in account.holdings.items())
+        total = account.balance + invested
+        results = analyze(values, account.transactions, invested / total if total else math.nan)
+        results.update(
+            resolution=resolution,
+            days=len(replay.dates),
+            trades=trades,
+            rejected=rejected,
+            final_value=total,
+            days_per_second=len(replay.dates) / elapsed if elapsed else math.nan,
+            trades_per_second=trades / elapsed if elapsed else math.nan,
+        )
+        return results
+    finally:
+        market.use_provider(previous_provider)
+        clock.use_clock(None)
+        database.use_storage(previous_storage)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("symbols", nargs="+", help="the symbols the policy trades")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="equal_weight")
+    parser.add_argument("--start", help="first day to replay, as YYYY-MM-DD; defaults to the earliest stored")
+    parser.add_argument("--end", help="last day to replay, as YYYY-MM-DD; defaults to the latest stored")
+    parser.add_argument("--lot-method", choices=LOT_METHODS, default=LOT_METHOD)
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random policy")
+    parser.add_argument("--runs", type=int, default=1, help="how many runs, each with the next seed")
+    args = parser.parse_args()
+
+    replay = ReplayMarket(args.symbols, args.start, args.end)
+    print(f"Replaying {len(replay.dates)} days of {', '.join(replay.symbols)} with {args.policy}")
+    for run in range(args.runs):
+        policy = POLICIES[args.policy](args.seed + run)
+        results = run_backtest(replay, policy, lot_method=args.lot_method)
+        print(
+            f"seed {args.seed + run}: return {results['total_return']:+.2%}, volatility {results['volatility']:.2%}, "
+            f"max drawdown {results['max_drawdown']:.2%}, Sharpe {results['sharpe']:.2f}, "
+            f"turnover {results['turnover']:.2f}, {results['trades']} trades, {results['rejected']} batches rejected; "
+            f"{results['days_per_second']:,.0f} days/s, {results['trades_per_second']:,.0f} trades/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+"""
+Microbenchmarks for the trading floor persistence layer.
+
+Each benchmark runs against a throwaway database in a temporary directory, so it never
+touches accounts.db. Run from this directory, for example:
+
+    uv run benchmark.py connections --ops 2000
+    uv run benchmark.py suite --accounts 100 --transactions 1000 --concurrency 8 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+workdir = tempfile.mkdtemp(prefix="trading_bench_")
+os.environ["ACCOUNTS_DB"] = os.path.join(workdir, "accounts.db")
+
+import database  # noqa: E402  (must be imported after ACCOUNTS_DB is set)
+from log_writer import LogWriter  # noqa: E402
+import accounts  # noqa: E402
+from account_cache import AccountCache  # noqa: E402
+from ledger import Ledger, Transaction  # noqa: E402
+from lots import LotBook, LOT_METHOD  # noqa: E402
+
+SYMBOLS = [f"S{i:03d}" for i in range(50)]
+PRICES = {symbol: 10.0 + i for i, symbol in enumerate(SYMBOLS)}
+
+
+def ops_per_second(fn, ops: int) -> float:
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    return ops / (time.perf_counter() - start)
+
+
+class ConnectPerCall:
+    """The original access pattern: a fresh connection and commit for every call."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with sqlite3.connect(path) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "name TEXT, datetime DATETIME, type TEXT, message TEXT)"
+            )
+
+    def write_account(self, name, account_dict):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "INSERT INTO accounts (name, account) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET account=excluded.account",
+                (name.lower(), json.dumps(account_dict)),
+            )
+            conn.commit()
+
+    def read_account(self, name):
+        with sqlite3.connect(self.path) as conn:
+            row = conn.execute("SELECT account FROM accounts WHERE name = ?", (name.lower(),)).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def write_log(self, name, type, message):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "INSERT INTO logs (name, datetime, type, message) VALUES (?, datetime('now'), ?, ?)",
+                (name.lower(), type, message),
+            )
+            conn.commit()
+
+    def read_log(self, name, last_n=10):
+        with sqlite3.connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT datetime, type, message FROM logs WHERE name = ? ORDER BY datetime DESC LIMIT ?",
+                (name.lower(), last_n),
+            ).fetchall()
+            return reversed(rows)
+
+
+def run_operations(store, ops: int) -> dict[str, float]:
+    account = {
+        "name": "bench",
+        "balance": 10_000.0,
+        "strategy": "",
+        "holdings": {},
+        "transactions": [],
+        "portfolio_value_time_series": [],
+    }
+    store.write_account("bench", account)
+    return {
+        "write_log": ops_per_second(lambda i: store.write_log("bench", "function", f"Message {i}"), ops),
+        "read_log": ops_per_second(lambda i: list(store.read_log("bench", last_n=13)), ops),
+        "write_account": ops_per_second(lambda i: store.write_account("bench", account), ops),
+        "read_account": ops_per_second(lambda i: store.read_account("bench"), ops),
+    }
+
+
+def bench_connections(args) -> dict:
+    before = run_operations(ConnectPerCall(os.path.join(workdir, "before.db")), args.ops)
+    after = run_operations(database, args.ops)
+    return {
+        name: {"before": before[name], "after": after[name], "speedup": after[name] / before[name]}
+        for name in before
+    }
+
+
+def bench_log_writer(args) -> dict:
+    before = ops_per_second(lambda i: database.write_log("bench", "function", f"Message {i}"), args.ops)
+    writer = LogWriter()
+    after = ops_per_second(lambda i: writer.write("bench", "function", f"Message {i}"), args.ops)
+    start = time.perf_counter()
+    writer.force_flush()
+    drained = args.ops / (time.perf_counter() - start + args.ops / after)
+    writer.shutdown()
+    return {
+        "write_log (caller)": {"before": before, "after": after, "speedup": after / before},
+        "write_log (drained)": {"before": before, "after": drained, "speedup": drained / before},
+    }
+
+
+def fill_logs(rows: int, names: list[str], chunk: int = 100_000) -> None:
+    conn = database.storage.connect()
+    for start in range(0, rows, chunk):
+        with conn:
+            conn.executemany(
+                "INSERT INTO logs (name, datetime, type, message) VALUES (?, datetime('now'), ?, ?)",
+                ((names[i % len(names)], "function", f"Message {i}") for i in range(start, min(start + chunk, rows))),
+            )
+
+
+def bench_logs(args) -> dict:
+    names = ["warren", "george", "ray", "cathie"]
+    fill_logs(args.rows, names)
+    conn = database.storage.connect()
+    unindexed = """
+        SELECT datetime, type, message FROM logs NOT INDEXED
+        WHERE name = ?
+        ORDER BY datetime DESC
+        LIMIT 13
+    """
+    before = ops_per_second(lambda i: conn.execute(unindexed, (names[i % 4],)).fetchall(), args.ops)
+    recent = ops_per_second(lambda i: list(database.read_log(names[i % 4], last_n=13)), args.ops)
+    cursors = {name: database.read_log_since(name, 0, last_n=1)[-1][0] for name in names}
+    tick = ops_per_second(lambda i: database.read_log_since(names[i % 4], cursors[names[i % 4]], last_n=13), args.ops)
+    return {
+        "read_log": {"before": before, "after": recent, "speedup": recent / before},
+        "dashboard tick": {"before": before, "after": tick, "speedup": tick / before},
+    }
+
+
+def bench_market(args) -> dict:
+    date = "2025-01-02"
+    market = {f"T{i:05d}": 10.0 + i / 100 for i in range(args.symbols)}
+    symbols = list(market)
+    database.write_prices(date, market)
+    # The original layout: the whole market as one JSON string per date, parsed on every cold read
+    conn = database.storage.connect()
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS market_json (date TEXT PRIMARY KEY, data TEXT)")
+        conn.execute("INSERT OR REPLACE INTO market_json VALUES (?, ?)", (date, json.dumps(market)))
+
+    def read_blob(i, count):
+        data = json.loads(conn.execute("SELECT data FROM market_json WHERE date = ?", (date,)).fetchone()[0])
+        return [data.get(symbols[(i + j) % len(symbols)]) for j in range(count)]
+
+    def read_rows(i, count):
+        return database.read_prices(date, [symbols[(i + j) % len(symbols)] for j in range(count)])
+
+    single_before = ops_per_second(lambda i: read_blob(i, 1), args.ops)
+    single_after = ops_per_second(lambda i: database.read_price(date, symbols[i % len(symbols)]), args.ops)
+    multi_before = ops_per_second(lambda i: read_blob(i, 30), args.ops)
+    multi_after = ops_per_second(lambda i: read_rows(i, 30), args.ops)
+    return {
+        "1 symbol": {"before": single_before, "after": single_after, "speedup": single_after / single_before},
+        "30 symbols": {"before": multi_before, "after": multi_after, "speedup": multi_after / multi_before},
+    }
+
+
+def print_latency(results: dict) -> None:
+    print(f"{'lookup':<22}{'before ms':>14}{'after ms':>14}{'speedup':>10}")
+    for name, row in results.items():
+        print(f"{name:<22}{1000 / row['before']:>14.3f}{1000 / row['after']:>14.3f}{row['speedup']:>9.1f}x")
+
+
+def seed_accounts(count: int, transactions: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    names = [f"bench{i}" for i in range(count)]
+    for name in names:
+        # Open each position large enough that the benchmark's sells never run out of shares
+        ledger = [
+            accounts.Transaction(
+                symbol=symbol, quantity=1_000_000, price=PRICES[symbol],
+                timestamp="2025-01-01 10:00:00", rationale="Opening position",
+            )
+            for symbol in SYMBOLS
+        ]
+        for i in range(transactions):
+            symbol = rng.choice(SYMBOLS)
+            ledger.append(accounts.Transaction(
+                symbol=symbol, quantity=rng.choice([-1, 1]) * rng.randint(1, 100), price=PRICES[symbol],
+                timestamp=str(datetime(2025, 1, 2, 10) + timedelta(seconds=i)), rationale="Seeded by the benchmark suite",
+            ))
+        holdings = {}
+        for t in ledger:
+            holdings[t.symbol] = holdings.get(t.symbol, 0) + t.quantity
+        cost_basis, net_spend, realized_pnl = accounts.replay_cost_basis(ledger)
+        book = LotBook.replay(ledger)
+        database.write_account(name, {
+            "name": name,
+            "balance": 1e12,
+            "strategy": "Benchmark",
+            "holdings": holdings,
+            "transactions": [t.model_dump() for t in ledger],
+            "portfolio_value_time_series": [],
+            "cost_basis": cost_basis,
+            "net_spend": net_spend,
+            "realized_pnl": realized_pnl,
+            "lot_method": LOT_METHOD,
+            "lots": {symbol: book.open_lots(symbol) for symbol in book.lots},
+            "lot_realized_pnl": book.realized,
+        })
+    return names
+
+
+def bench_cache(args) -> dict:
+    accounts.get_share_prices = lambda symbols: {symbol: PRICES[symbol] for symbol in symbols}
+    # A fresh account for every run, since buys and reports grow the account they touch
+    names = iter(seed_accounts(8, args.transactions, seed=42))
+    cached = AccountCache(ttl=60)
+    write_behind = AccountCache(ttl=60, write_behind=0.5)
+    buy = lambda account: account.buy_shares(SYMBOLS[0], 1, "Benchmark")
+    operations = {
+        "get_balance": lambda account: account.balance,
+        "report": lambda account: account.report(),
+        "buy_shares": buy,
+    }
+    results = {}
+    for operation, fn in operations.items():
+        uncached_name, cached_name = next(names), next(names)
+        before = ops_per_second(lambda i: fn(accounts.Account.get(uncached_name)), args.ops)
+        after = ops_per_second(lambda i: cached.use(cached_name, fn), args.ops)
+        results[operation] = {"before": before, "after": after, "speedup": after / before}
+    # Trades always write through, so only the portfolio value a report records can be deferred
+    name = next(names)
+    before = results["report"]["before"]
+    after = ops_per_second(lambda i: write_behind.use(name, operations["report"]), args.ops)
+    write_behind.flush()
+    results["report write-behind"] = {"before": before, "after": after, "speedup": after / before}
+    print(f"Cache stats: {cached.stats()}")
+    return results
+
+
+def bench_polygon(args) -> dict:
+    import fake_polygon
+    import polygon_client
+    from polygon import RESTClient
+
+    server = fake_polygon.serve()
+    symbols = [symbol.lower() for symbol in SYMBOLS]
+    shared = polygon_client.create_client(base=server.url, api_key="fake")
+    operations = {
+        "snapshot 1 symbol": lambda client, i: client.get_snapshot_ticker("stocks", symbols[i % len(symbols)]),
+        "snapshot 30 symbols": lambda client, i: client.get_snapshot_all("stocks", tickers=symbols[:30]),
+    }
+    results = {}
+    for operation, fn in operations.items():
+        # The original pattern: a new client, and so a new connection, for every lookup
+        before = ops_per_second(lambda i: fn(RESTClient("fake", base=server.url), i), args.ops)
+        after = ops_per_second(lambda i: fn(shared, i), args.ops)
+        results[operation] = {"before": before, "after": after, "speedup": after / before}
+    print(f"Shared client: {polygon_client.stats(shared)}; server saw {server.stats()}")
+    server.shutdown()
+
+    # Fail every few requests, and check every lookup still gets through on a retry
+    flaky = fake_polygon.serve(fail_every=args.fail_every)
+    client = polygon_client.create_client(base=flaky.url, api_key="fake")
+    retried = polygon_client.CountingRetry.retried
+    for i in range(args.ops):
+        operations["snapshot 1 symbol"](client, i)
+    print(
+        f"With every {args.fail_every}th request failing: {args.ops} lookups succeeded after "
+        f"{polygon_client.CountingRetry.retried - retried} retries; server saw {flaky.stats()}"
+    )
+    flaky.shutdown()
+    return results
+
+
+def allocated(build) -> tuple[object, float]:
+    """Return what build() makes, and the MB it allocated."""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size / 1_000_000
+
+
+def elapsed_ms(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def bench_ledger(args) -> dict:
+    name = seed_accounts(1, args.transactions, seed=42)[0]
+    conn = database.storage.connect()
+    rows = conn.execute(
+        "SELECT symbol, quantity, price, timestamp, rationale FROM transactions WHERE name = ? ORDER BY id", (name,)
+    ).fetchall()
+    keys = ("symbol", "quantity", "price", "timestamp", "rationale")
+    # The original representation: a pydantic Transaction per row, rationale included
+    models, models_mb = allocated(lambda: [Transaction(**dict(zip(keys, row))) for row in rows])
+    ledger, ledger_mb = allocated(lambda: Ledger.from_rows([row[:4] for row in rows], load_rationales=lambda: []))
+    full = Ledger.from_rows(rows)
+    ledger.append(models[-1])
+    results = {
+        "memory MB": (models_mb, ledger_mb),
+        "load ms": (
+            elapsed_ms(lambda: [Transaction(**dict(zip(keys, row))) for row in rows]),
+            elapsed_ms(lambda: Ledger.from_rows([row[:4] for row in rows], load_rationales=lambda: [])),
+        ),
+        "Account.get ms": (None, elapsed_ms(lambda: accounts.Account.get(name))),
+        "serialise ms": (
+            elapsed_ms(lambda: [t.model_dump() for t in models]),
+            elapsed_ms(lambda: full.to_dicts()),
+        ),
+        "save 1 new ms": (
+            elapsed_ms(lambda: [t.model_dump() for t in models[-1:]]),
+            elapsed_ms(lambda: ledger.to_dicts(len(ledger) - 1)),
+        ),
+    }
+    return {metric: {"before": before, "after": after} for metric, (before, after) in results.items()}
+
+
+def print_comparison(results: dict) -> None:
+    print(f"{'measure':<22}{'before':>14}{'after':>14}{'ratio':>10}")
+    for name, row in results.items():
+        before = f"{row['before']:,.2f}" if row["before"] is not None else "-"
+        ratio = f"{row['before'] / row['after']:.1f}x" if row["before"] is not None and row["after"] else ""
+        print(f"{name:<22}{before:>14}{row['after']:>14,.2f}{ratio:>10}")
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(fn, ops: int, concurrency: int) -> dict:
+    def timed(i):
+        start = time.perf_counter()
+        fn(i)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(timed, range(ops)))
+    elapsed = time.perf_counter() - start
+    return {
+        "ops": ops,
+        "throughput": ops / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def database_size(backend: str) -> int | None:
+    if backend != "sqlite":
+        return None
+    return sum(os.path.getsize(path) for path in (database.DB, database.DB + "-wal") if os.path.exists(path))
+
+
+def bench_suite(args) -> dict:
+    database.use_storage(database.create_storage(args.backend))
+    # Fixed prices keep the suite offline and the numbers about storage rather than the market
+    accounts.get_share_prices = lambda symbols: {symbol: PRICES[symbol] for symbol in symbols}
+    names = seed_accounts(args.accounts, args.transactions, args.seed)
+    pick = lambda i: names[i % len(names)]
+    symbol = lambda i: SYMBOLS[i % len(SYMBOLS)]
+    operations = {
+        "buy_shares": lambda i: accounts.Account.get(pick(i)).buy_shares(symbol(i), 1, "Benchmark"),
+        "sell_shares": lambda i: accounts.Account.get(pick(i)).sell_shares(symbol(i), 1, "Benchmark"),
+        "report": lambda i: accounts.Account.get(pick(i)).report(),
+        "write_log": lambda i: database.write_log(pick(i), "function", f"Benchmark message {i}"),
+        "read_log": lambda i: database.read_log(pick(i), last_n=13),
+    }
+    results = {name: measure(fn, args.ops, args.concurrency) for name, fn in operations.items()}
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "parameters": {
+            "backend": args.backend,
+            "accounts": args.accounts,
+            "transactions": args.transactions,
+            "ops": args.ops,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+        "operations": results,
+        "db_size_bytes": database_size(args.backend),
+    }
+
+
+def print_suite(results: dict, output: str | None = None, baseline: str | None = None) -> None:
+    previous = {}
+    if baseline:
+        with open(baseline) as f:
+            previous = json.load(f)["operations"]
+    print(f"{'operation':<14}{'ops/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'vs baseline':>14}")
+    for name, row in results["operations"].items():
+        change = f"{row['throughput'] / previous[name]['throughput']:.2f}x" if name in previous else ""
+        print(
+            f"{name:<14}{row['throughput']:>12,.0f}{row['p50_ms']:>10.2f}"
+            f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{change:>14}"
+        )
+    if results["db_size_bytes"] is not None:
+        print(f"Database size: {results['db_size_bytes'] / 1_000_000:,.1f} MB")
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {output}")
+
+
+def print_table(results: dict) -> None:
+    print(f"{'operation':<22}{'before ops/s':>14}{'after ops/s':>14}{'speedup':>10}")
+    for name, row in results.items():
+        print(f"{name:<22}{row['before']:>14,.0f}{row['after']:>14,.0f}{row['speedup']:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    connections = subparsers.add_parser("connections", help="connect-per-call versus pooled WAL connections")
+    connections.add_argument("--ops", type=int, default=2000)
+    connections.set_defaults(run=bench_connections, show=print_table)
+
+    log_writer = subparsers.add_parser("log_writer", help="synchronous write_log versus the background LogWriter")
+    log_writer.add_argument("--ops", type=int, default=20000)
+    log_writer.set_defaults(run=bench_log_writer, show=print_table)
+
+    logs = subparsers.add_parser("logs", help="dashboard log reads against a large logs table")
+    logs.add_argument("--rows", type=int, default=10_000_000)
+    logs.add_argument("--ops", type=int, default=20)
+    logs.set_defaults(run=bench_logs, show=print_table)
+
+    market = subparsers.add_parser("market", help="cold price lookups: JSON market blob versus the prices table")
+    market.add_argument("--symbols", type=int, default=10_000)
+    market.add_argument("--ops", type=int, default=200)
+    market.set_defaults(run=bench_market, show=print_latency)
+
+    cache = subparsers.add_parser("cache", help="Account.get on every call versus the in-process account cache")
+    cache.add_argument("--transactions", type=int, default=1000, help="seeded transactions in the account")
+    cache.add_argument("--ops", type=int, default=500)
+    cache.set_defaults(run=bench_cache, show=print_table)
+
+    polygon = subparsers.add_parser("polygon", help="a Polygon client per lookup versus one pooled client, offline")
+    polygon.add_argument("--ops", type=int, default=500)
+    polygon.add_argument("--fail-every", type=int, default=5, help="fail every Nth request in the retry check")
+    polygon.set_defaults(run=bench_polygon, show=print_table)
+
+    ledger = subparsers.add_parser("ledger", help="Transaction models versus the columnar Ledger for one long account")
+    ledger.add_argument("--transactions", type=int, default=100_000)
+    ledger.set_defaults(run=bench_ledger, show=print_comparison)
+
+    suite = subparsers.add_parser("suite", help="account and log operations at scale, with latency percentiles")
+    suite.add_argument("--backend", choices=["sqlite", "memory"], default="sqlite")
+    suite.add_argument("--accounts", type=int, default=100)
+    suite.add_argument("--transactions", type=int, default=1000, help="seeded transactions per account")
+    suite.add_argument("--ops", type=int, default=500, help="calls per operation")
+    suite.add_argument("--concurrency", type=int, default=4)
+    suite.add_argument("--seed", type=int, default=42)
+    suite.add_argument("--output", help="write the results to this JSON file")
+    suite.add_argument("--baseline", help="compare throughput against a previous JSON results file")
+    suite.set_defaults(
+        run=bench_suite, show=lambda results: print_suite(results, args.output, args.baseline)
+    )
+
+    args = parser.parse_args()
+    args.show(args.run(args))
+
+
+if __name__ == "__main__":
+    main()
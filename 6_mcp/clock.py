@@ -0,0 +1,76 @@
+import os
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from value_series import TIME_FORMAT
+
+load_dotenv(override=True)
+
+# Run the whole trading floor on simulated time: from the wall-clock moment SIMULATED_CLOCK_ANCHOR
+# (by default, midnight at the start of today), time runs on from SIMULATED_CLOCK_START at
+# SIMULATED_CLOCK_SPEED times real time. Every process reads the same settings, so they all agree.
+SIMULATED_CLOCK_START = os.getenv("SIMULATED_CLOCK_START")
+SIMULATED_CLOCK_ANCHOR = os.getenv("SIMULATED_CLOCK_ANCHOR")
+SIMULATED_CLOCK_SPEED = float(os.getenv("SIMULATED_CLOCK_SPEED", "1"))
+
+
+class ScaledClock:
+    """Simulated time that starts at start when the wall clock reads anchor, and runs speed times as fast."""
+
+    def __init__(self, start: datetime, anchor: datetime, speed: float = 1.0):
+        self.start = start
+        self.anchor = anchor
+        self.speed = speed
+
+    def __call__(self) -> datetime:
+        return self.start + (datetime.now() - self.anchor) * self.speed
+
+
+def clock_from_env() -> Callable[[], datetime]:
+    """The clock the environment asks for: a ScaledClock if SIMULATED_CLOCK_START is set, else the wall clock."""
+    if not SIMULATED_CLOCK_START:
+        return datetime.now
+    if SIMULATED_CLOCK_ANCHOR:
+        anchor = datetime.fromisoformat(SIMULATED_CLOCK_ANCHOR)
+    else:
+        anchor = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return ScaledClock(datetime.fromisoformat(SIMULATED_CLOCK_START), anchor, SIMULATED_CLOCK_SPEED)
+
+
+_default_clock = clock_from_env()
+_clock: Callable[[], datetime] = _default_clock
+
+
+def now() -> datetime:
+    """The current time by the clock in use: the wall clock, unless a simulation has set another."""
+    return _clock()
+
+
+def timestamp() -> str:
+    """The current time as a 'YYYY-MM-DD HH:MM:SS' timestamp."""
+    return now().strftime(TIME_FORMAT)
+
+
+def use_clock(clock: Callable[[], datetime] | None) -> None:
+    """Tell the time by clock from now on, or by the environment's clock again if clock is None."""
+    global _clock
+    _clock = clock or _default_clock
+
+
+class SimulatedClock:
+    """
+    A deterministic clock for replays: it reads whatever time it was last set to, and moves on by tick
+    each time it's read, so trades made at the same simulated moment still get distinct timestamps.
+    """
+
+    def __init__(self, start: datetime, tick: timedelta = timedelta(seconds=1)):
+        self.time = start
+        self.tick = tick
+
+    def __call__(self) -> datetime:
+        current = self.time
+        self.time += self.tick
+        return current
+
+    def set(self, time: datetime) -> None:
+        self.time = time
@@ -1,101 +1,81 @@
-import sqlite3
-import json
-from datetime import datetime
+import os
 from dotenv import load_dotenv
+from storage import Storage, ConcurrentUpdateError, LOG_RETENTION_DAYS, LOG_RETENTION_ROWS
+from value_series import RAW
 
 load_dotenv(override=True)
 
-DB = "accounts.db"
-
-
-with sqlite3.connect(DB) as conn:
-    cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            datetime DATETIME,
-            type TEXT,
-            message TEXT
-        )
-    ''')
-    cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
-    conn.commit()
-
-def write_account(name, account_dict):
-    json_data = json.dumps(account_dict)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO accounts (name, account)
-            VALUES (?, ?)
-            ON CONFLICT(name) DO UPDATE SET account=excluded.account
-        ''', (name.lower(), json_data))
-        conn.commit()
+DB = os.getenv("ACCOUNTS_DB", "accounts.db")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").strip().lower()
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    """Create the storage backend named by STORAGE_BACKEND: 'sqlite' (the default) or 'memory'."""
+    if backend == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(DB)
+    elif backend == "memory":
+        from memory_storage import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend {backend}")
+
+
+storage = create_storage()
+
+
+def use_storage(new_storage: Storage) -> None:
+    """Route every function in this module to a different backend from now on."""
+    global storage
+    storage = new_storage
+
+
+def write_account(name, account_dict, expected_version: int | None = None) -> int:
+    return storage.write_account(name, account_dict, expected_version)
+
+def create_account(name, account_dict) -> bool:
+    return storage.create_account(name, account_dict)
+
+def update_account(name, expected_version, fields, holdings, transactions, portfolio_values, lots=None) -> int:
+    return storage.update_account(name, expected_version, fields, holdings, transactions, portfolio_values, lots)
 
 def read_account(name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT account FROM accounts WHERE name = ?', (name.lower(),))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
-    
+    return storage.read_account(name)
+
+def read_portfolio_values(name: str, resolution: str = RAW, since: str | None = None):
+    return storage.read_portfolio_values(name, resolution, since)
+
 def write_log(name: str, type: str, message: str):
-    """
-    Write a log entry to the logs table.
-    
-    Args:
-        name (str): The name associated with the log
-        type (str): The type of log entry
-        message (str): The log message
-    """
-    now = datetime.now().isoformat()
-    
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO logs (name, datetime, type, message)
-            VALUES (?, datetime('now'), ?, ?)
-        ''', (name.lower(), type, message))
-        conn.commit()
-
-def read_log(name: str, last_n=10):
-    """
-    Read the most recent log entries for a given name.
-    
-    Args:
-        name (str): The name to retrieve logs for
-        last_n (int): Number of most recent entries to retrieve
-        
-    Returns:
-        list: A list of tuples containing (datetime, type, message)
-    """
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datetime, type, message FROM logs 
-            WHERE name = ? 
-            ORDER BY datetime DESC
-            LIMIT ?
-        ''', (name.lower(), last_n))
-        
-        return reversed(cursor.fetchall())
+    storage.write_log(name, type, message)
+
+def write_logs(entries: list[tuple[str, str, str, str]]) -> None:
+    storage.write_logs(entries)
+
+def read_log(name: str, last_n=10, since: str | None = None, until: str | None = None):
+    return storage.read_log(name, last_n, since, until)
+
+def read_log_since(name: str, after_id: int = 0, last_n: int = -1):
+    return storage.read_log_since(name, after_id, last_n)
+
+def roll_logs(max_age_days: int = LOG_RETENTION_DAYS, max_rows: int = LOG_RETENTION_ROWS) -> int:
+    return storage.roll_logs(max_age_days, max_rows)
+
+def write_prices(date: str, prices: dict[str, float]) -> None:
+    storage.write_prices(date, prices)
+
+def has_prices(date: str) -> bool:
+    return storage.has_prices(date)
+
+def read_price(date: str, symbol: str) -> float | None:
+    return storage.read_price(date, symbol)
+
+def read_prices(date: str, symbols: list[str]) -> dict[str, float]:
+    return storage.read_prices(date, symbols)
 
 def write_market(date: str, data: dict) -> None:
-    data_json = json.dumps(data)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO market (date, data)
-            VALUES (?, ?)
-            ON CONFLICT(date) DO UPDATE SET data=excluded.data
-        ''', (date, data_json))
-        conn.commit()
+    storage.write_prices(date, data)
 
 def read_market(date: str) -> dict | None:
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
\ No newline at end of file
+    return storage.read_market(date)
+
+def read_price_dates(since: str | None = None, until: str | None = None) -> list[str]:
+    return storage.read_price_dates(since, until)
@@ -0,0 +1,124 @@
+"""
+A local stand-in for the parts of the Polygon REST API that market.py uses, for trying out the client's
+connection pooling and retries offline. It serves made-up but stable prices over keep-alive HTTP/1.1,
+counts the connections clients open, and can fail every Nth request to exercise retries. Run from this
+directory, then point the trading floor at it, for example:
+
+    uv run fake_polygon.py --port 8765 --fail-every 5
+    POLYGON_BASE_URL=http://127.0.0.1:8765 POLYGON_API_KEY=fake POLYGON_PLAN=paid uv run market_server.py
+"""
+
+import argparse
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SNAPSHOT_PREFIX = "/v2/snapshot/locale/us/markets/stocks/tickers"
+GROUPED_PREFIX = "/v2/aggs/grouped/locale/us/market/stocks/"
+# The symbols a grouped daily or whole-market snapshot request returns
+MARKET = ["AAPL", "AMZN", "GOOGL", "META", "MSFT", "NVDA", "SPY", "TSLA"]
+
+
+def price(symbol: str) -> float:
+    """A made-up price that is the same for a symbol on every request and in every process."""
+    return round(10 + zlib.crc32(symbol.encode()) % 49000 / 100, 2)
+
+
+def snapshot(symbol: str) -> dict:
+    close = price(symbol)
+    return {"ticker": symbol, "min": {"c": close}, "prevDay": {"c": round(close * 0.99, 2)}}
+
+
+class FakePolygonServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fail_every: int = 0):
+        super().__init__(address, FakePolygonHandler)
+        self.fail_every = fail_every
+        self.requests = 0
+        self.connections = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"requests": self.requests, "connections": self.connections, "failures": self.failures}
+
+
+class FakePolygonHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open between requests, as the real API does
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, which Nagle would hold up on a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            fail = self.server.fail_every and self.server.requests % self.server.fail_every == 0
+            if fail:
+                self.server.failures += 1
+        if fail:
+            return self.send_json(503, {"status": "ERROR", "error": "Injected failure"})
+        url = urlparse(self.path)
+        if url.path == "/v1/marketstatus/now":
+            return self.send_json(200, {"market": "open"})
+        if url.path.startswith("/v2/aggs/ticker/") and url.path.endswith("/prev"):
+            symbol = url.path.split("/")[4]
+            day = int(time.time() // 86400 - 1) * 86400 * 1000
+            return self.send_json(200, {"results": [{"T": symbol, "c": price(symbol), "t": day}]})
+        if url.path.startswith(GROUPED_PREFIX):
+            return self.send_json(200, {"results": [{"T": symbol, "c": price(symbol)} for symbol in MARKET]})
+        if url.path.startswith(SNAPSHOT_PREFIX + "/"):
+            return self.send_json(200, {"ticker": snapshot(url.path[len(SNAPSHOT_PREFIX) + 1:])})
+        if url.path == SNAPSHOT_PREFIX:
+            tickers = parse_qs(url.query).get("tickers", [",".join(MARKET)])[0].split(",")
+            return self.send_json(200, {"tickers": [snapshot(symbol) for symbol in tickers if symbol]})
+        self.send_json(404, {"status": "NOT_FOUND"})
+
+    def send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(port: int = 0, fail_every: int = 0) -> FakePolygonServer:
+    """Start a fake Polygon server on a background thread; port 0 picks a free port."""
+    server = FakePolygonServer(("127.0.0.1", port), fail_every)
+    threading.Thread(target=server.serve_forever, name="fake-polygon", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth request with a 503")
+    args = parser.parse_args()
+    server = FakePolygonServer(("127.0.0.1", args.port), args.fail_every)
+    print(f"Fake Polygon listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Served {server.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+from array import array
+from datetime import date, datetime
+from functools import lru_cache
+from collections.abc import Callable, Iterable, Sequence
+from pydantic import BaseModel
+from pydantic_core import core_schema
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_EPOCH = datetime(1970, 1, 1)
+
+
+class Transaction(BaseModel):
+    symbol: str
+    quantity: int
+    price: float
+    timestamp: str
+    rationale: str
+
+    def total(self) -> float:
+        return self.quantity * self.price
+
+    def __repr__(self):
+        return f"{abs(self.quantity)} shares of {self.symbol} at {self.price} each."
+
+
+def to_epoch(timestamp: str) -> int | None:
+    """Seconds since the epoch for a 'YYYY-MM-DD HH:MM:SS' wall-clock timestamp, or None for any other format."""
+    if len(timestamp) != 19 or timestamp[4:11:3] != "-- " or timestamp[13:17:3] != "::":
+        return None
+    try:
+        return int((datetime.fromisoformat(timestamp) - _EPOCH).total_seconds())
+    except (ValueError, TypeError):
+        return None
+
+
+# Formatting by table lookup is several times faster than strftime, which matters for long ledgers
+_HOURS_MINUTES = [f" {hour:02d}:{minute:02d}:" for hour in range(24) for minute in range(60)]
+_SECONDS = [f"{second:02d}" for second in range(60)]
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+
+
+@lru_cache(maxsize=4096)
+def _day(days: int) -> str:
+    return date.fromordinal(_EPOCH_ORDINAL + days).isoformat()
+
+
+def from_epoch(epoch: int) -> str:
+    """The 'YYYY-MM-DD HH:MM:SS' timestamp for seconds since the epoch; the inverse of to_epoch."""
+    days, seconds = divmod(epoch, 86400)
+    minutes, seconds = divmod(seconds, 60)
+    return _day(days) + _HOURS_MINUTES[minutes] + _SECONDS[seconds]
+
+
+class Ledger(Sequence):
+    """
+    An account's transactions, stored column by column.
+
+    Symbols are interned to small ids, and quantities, prices and timestamps (as epoch seconds)
+    live in typed arrays, so a long ledger takes a fraction of the memory of Transaction models and
+    turns into dicts without going through pydantic. Rationale text is only needed for display, so
+    a ledger read from storage can leave it behind and fetch it on first use.
+
+    Indexing or iterating yields Transaction models built on demand, so code written against a list
+    of Transactions keeps working.
+    """
+
+    def __init__(self):
+        self.symbols: list[str] = []
+        self._symbol_ids: dict[str, int] = {}
+        self.symbol_ids = array("i")
+        self.quantities = array("q")
+        self.prices = array("d")
+        self.epochs = array("q")
+        # Timestamps that aren't in the usual format, kept verbatim by position
+        self._odd_timestamps: dict[int, str] = {}
+        # None marks a rationale still to be fetched by _load_rationales
+        self._rationales: list[str | None] = []
+        self._load_rationales: Callable[[], list[str]] | None = None
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple], load_rationales: Callable[[], list[str]] | None = None) -> "Ledger":
+        """
+        Build a ledger from (symbol, quantity, price, timestamp) or (symbol, quantity, price, timestamp, rationale)
+        rows. Without rationales, load_rationales is called on first use to return them all, in order.
+        """
+        rows = rows if isinstance(rows, list) else list(rows)
+        ledger = cls()
+        symbol_ids = ledger._symbol_ids
+        for symbol in dict.fromkeys(row[0] for row in rows):
+            symbol_ids[symbol] = len(ledger.symbols)
+            ledger.symbols.append(symbol)
+        ledger.symbol_ids = array("i", [symbol_ids[row[0]] for row in rows])
+        ledger.quantities = array("q", [row[1] for row in rows])
+        ledger.prices = array("d", [row[2] for row in rows])
+        epochs = [to_epoch(row[3]) for row in rows]
+        if None in epochs:
+            for index, epoch in enumerate(epochs):
+                if epoch is None:
+                    ledger._odd_timestamps[index] = rows[index][3]
+                    epochs[index] = 0
+        ledger.epochs = array("q", epochs)
+        ledger._rationales = [row[4] if len(row) > 4 else None for row in rows]
+        ledger._load_rationales = load_rationales
+        return ledger
+
+    @classmethod
+    def from_transactions(cls, transactions: Iterable[Transaction | dict]) -> "Ledger":
+        ledger = cls()
+        for t in transactions:
+            if isinstance(t, dict):
+                ledger._append(t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"])
+            else:
+                ledger._append(t.symbol, t.quantity, t.price, t.timestamp, t.rationale)
+        return ledger
+
+    def _append(self, symbol: str, quantity: int, price: float, timestamp: str, rationale: str | None) -> None:
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self._symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        epoch = to_epoch(timestamp)
+        if epoch is None:
+            self._odd_timestamps[len(self.quantities)] = timestamp
+            epoch = 0
+        self.symbol_ids.append(symbol_id)
+        self.quantities.append(quantity)
+        self.prices.append(price)
+        self.epochs.append(epoch)
+        self._rationales.append(rationale)
+
+    def append(self, transaction: Transaction) -> None:
+        self._append(transaction.symbol, transaction.quantity, transaction.price, transaction.timestamp, transaction.rationale)
+
+    def __len__(self) -> int:
+        return len(self.quantities)
+
+    def timestamp(self, index: int) -> str:
+        odd = self._odd_timestamps.get(index)
+        return odd if odd is not None else from_epoch(self.epochs[index])
+
+    def rationale(self, index: int) -> str:
+        if self._rationales[index] is None:
+            self._fetch_rationales()
+        return self._rationales[index]
+
+    def _fetch_rationales(self) -> None:
+        loaded = self._load_rationales() if self._load_rationales else []
+        for index, rationale in enumerate(self._rationales):
+            if rationale is None:
+                self._rationales[index] = loaded[index] if index < len(loaded) else ""
+        self._load_rationales = None
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return Transaction.model_construct(
+            symbol=self.symbols[self.symbol_ids[index]],
+            quantity=self.quantities[index],
+            price=self.prices[index],
+            timestamp=self.timestamp(index),
+            rationale=self.rationale(index),
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_dicts(self, start: int = 0, stop: int | None = None) -> list[dict]:
+        """Return transactions start to stop as the dicts Transaction.model_dump would give, without any models."""
+        stop = len(self) if stop is None else stop
+        rationales = self._rationales[start:stop]
+        if None in rationales:
+            self._fetch_rationales()
+            rationales = self._rationales[start:stop]
+        timestamps = [from_epoch(epoch) for epoch in self.epochs[start:stop]]
+        for index, timestamp in self._odd_timestamps.items():
+            if start <= index < stop:
+                timestamps[index - start] = timestamp
+        symbols = [self.symbols[symbol_id] for symbol_id in self.symbol_ids[start:stop]]
+        return [
+            {"symbol": symbol, "quantity": quantity, "price": price, "timestamp": timestamp, "rationale": rationale}
+            for symbol, quantity, price, timestamp, rationale in zip(
+                symbols, self.quantities[start:stop], self.prices[start:stop], timestamps, rationales
+            )
+        ]
+
+    @classmethod
+    def validate(cls, value) -> "Ledger":
+        return value if isinstance(value, Ledger) else cls.from_transactions(value)
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source, handler):
+        # Accept a Ledger or a list of Transactions or dicts, and dump as a list of dicts like a list[Transaction]
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(lambda ledger: ledger.to_dicts()),
+        )
@@ -0,0 +1,68 @@
+import gzip
+import json
+import os
+from collections import defaultdict
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "logs_archive")
+
+
+def archive_path(day: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"logs-{day}.jsonl.gz")
+
+
+def append(rows: list[tuple[int, str, str, str, str]]) -> None:
+    """
+    Append log rows to the per-day archive files, one JSON object per line.
+
+    Args:
+        rows (list): Tuples of (id, name, datetime, type, message); datetime decides the day file
+    """
+    by_day = defaultdict(list)
+    for id, name, timestamp, type, message in rows:
+        by_day[timestamp[:10]].append({"id": id, "name": name, "datetime": timestamp, "type": type, "message": message})
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for day, entries in by_day.items():
+        # Appending in gzip mode adds a new member to the file; gzip.open reads them all back
+        with gzip.open(archive_path(day), "at", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+
+def read(name: str, since: str, until: str | None = None, before_id: int | None = None) -> list[tuple[int, str, str, str]]:
+    """
+    Read archived log entries for a name within [since, until), oldest first.
+
+    Args:
+        name (str): The name to retrieve logs for
+        since (str): Inclusive lower bound on datetime, as 'YYYY-MM-DD HH:MM:SS' or a prefix of it
+        until (str): Exclusive upper bound on datetime, or None for no bound
+        before_id (int): Only return entries with an id lower than this, or None for no bound
+
+    Returns:
+        list: A list of tuples containing (id, datetime, type, message)
+    """
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    days = sorted(
+        f[len("logs-"):-len(".jsonl.gz")]
+        for f in os.listdir(ARCHIVE_DIR)
+        if f.startswith("logs-") and f.endswith(".jsonl.gz")
+    )
+    name = name.lower()
+    results = {}
+    for day in days:
+        if day < since[:10] or (until is not None and day > until[:10]):
+            continue
+        with gzip.open(archive_path(day), "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["name"] != name or entry["datetime"] < since:
+                    continue
+                if until is not None and entry["datetime"] >= until:
+                    continue
+                if before_id is not None and entry["id"] >= before_id:
+                    continue
+                results[entry["id"]] = (entry["id"], entry["datetime"], entry["type"], entry["message"])
+    return [results[id] for id in sorted(results)]
@@ -0,0 +1,100 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from database import write_logs
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.5
+MAX_QUEUED = 10_000
+
+_STOP = object()
+
+
+class LogWriter:
+    """
+    Buffer log entries in memory and write them to the database from a background thread.
+
+    Callers only pay for a queue put. The writer thread collects entries into batches and
+    writes each batch with a single executemany, either when BATCH_SIZE entries have
+    accumulated or FLUSH_INTERVAL seconds after the first entry of the batch arrived.
+    The queue is bounded: when it is full, write() drops the entry and counts it rather than
+    wait, since it is called from tracer hooks on the agents' event loop.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_queued=MAX_QUEUED):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._dropped_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, name: str, type: str, message: str) -> None:
+        """Queue a log entry, timestamped now, for the writer thread."""
+        self._ensure_started()
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            self._queue.put_nowait((name, timestamp, type, message))
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def force_flush(self, timeout: float | None = None) -> bool:
+        """Block until everything queued before this call has been written."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def shutdown(self, timeout: float | None = None) -> None:
+        """Write everything that is queued, then stop the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _flush(self, batch: list) -> None:
+        if not batch:
+            return
+        try:
+            write_logs(batch)
+        except Exception as e:
+            print(f"Failed to write {len(batch)} log entries: {e}")
+        batch.clear()
+
+    def _run(self):
+        batch = []
+        while True:
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    self._flush(batch)
+                    return
+                if isinstance(item, threading.Event):
+                    self._flush(batch)
+                    item.set()
+                    break
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+
+log_writer = LogWriter()
+atexit.register(log_writer.shutdown)
@@ -0,0 +1,152 @@
+import os
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+FIFO = "FIFO"
+LIFO = "LIFO"
+SPECIFIC = "SPECIFIC"
+LOT_METHODS = (FIFO, LIFO, SPECIFIC)
+
+# Which lots a sale consumes when the seller doesn't name them
+LOT_METHOD = os.getenv("LOT_METHOD", FIFO).strip().upper()
+
+
+class LotBook:
+    """
+    The open tax lots of an account, and the P&L realized against them, symbol by symbol.
+
+    Each buy opens a lot of (lot_id, quantity, price, timestamp), where lot_id is the buy's position
+    in the ledger. Lots are held oldest first in a deque per symbol, so FIFO and LIFO sales consume
+    from either end in time proportional to the lots they close; a specific-ID sale names its lots.
+    Realized P&L per symbol accumulates as lots are closed, and unrealized P&L is marked from the
+    open lots on demand, so neither needs a replay of the ledger.
+
+    The symbols touched since the last mark_saved() are kept in dirty, so a save only writes those.
+    """
+
+    def __init__(self, lots: dict[str, list[tuple]] | None = None, realized: dict[str, float] | None = None):
+        self.lots: dict[str, deque] = {symbol: deque(symbol_lots) for symbol, symbol_lots in (lots or {}).items() if symbol_lots}
+        self.realized: dict[str, float] = dict(realized or {})
+        self.dirty: set[str] = set()
+
+    @classmethod
+    def replay(cls, transactions, method: str = LOT_METHOD) -> "LotBook":
+        """ Rebuild the lots from scratch from a ledger, for accounts saved before lots were tracked. """
+        book = cls()
+        # The ledger doesn't say which lots a specific-ID sale closed, so those replay as FIFO
+        method = FIFO if method == SPECIFIC else method
+        for lot_id, transaction in enumerate(transactions):
+            if transaction.quantity > 0:
+                book.buy(lot_id, transaction.symbol, transaction.quantity, transaction.price, transaction.timestamp)
+            else:
+                held = sum(lot[1] for lot in book.lots.get(transaction.symbol, ()))
+                book.sell(transaction.symbol, min(-transaction.quantity, held), transaction.price, method)
+        return book
+
+    def record(self, lot_id: int, transaction, method: str = LOT_METHOD, lot_ids: list[int] | None = None) -> float:
+        """ Apply a transaction: a buy opens lot_id, a sale closes lots. Returns the P&L realized. """
+        if transaction.quantity > 0:
+            self.buy(lot_id, transaction.symbol, transaction.quantity, transaction.price, transaction.timestamp)
+            return 0.0
+        return self.sell(transaction.symbol, -transaction.quantity, transaction.price, method, lot_ids)
+
+    def buy(self, lot_id: int, symbol: str, quantity: int, price: float, timestamp: str) -> None:
+        self.lots.setdefault(symbol, deque()).append((lot_id, quantity, price, timestamp))
+        self.dirty.add(symbol)
+
+    def sell(self, symbol: str, quantity: int, price: float, method: str = LOT_METHOD, lot_ids: list[int] | None = None) -> float:
+        """
+        Close quantity shares of symbol against its lots, chosen by method or, if given, by lot_ids in that order.
+
+        Raises ValueError, without changing anything, if the chosen lots don't hold enough shares.
+        """
+        self.check_sell(symbol, quantity, method, lot_ids)
+        lots = self.lots.get(symbol, deque())
+        realized, remaining = 0.0, quantity
+        if lot_ids:
+            by_id = {lot[0]: lot for lot in lots}
+            closed = set()
+            for lot_id in lot_ids:
+                if remaining == 0:
+                    break
+                lot = by_id[lot_id]
+                taken = min(remaining, lot[1])
+                realized += taken * (price - lot[2])
+                remaining -= taken
+                if taken == lot[1]:
+                    closed.add(lot_id)
+                else:
+                    by_id[lot_id] = (lot_id, lot[1] - taken, lot[2], lot[3])
+            lots = deque(by_id[lot[0]] for lot in lots if lot[0] not in closed)
+        else:
+            take = lots.pop if method == LIFO else lots.popleft
+            put = lots.append if method == LIFO else lots.appendleft
+            while remaining > 0 and lots:
+                lot_id, held, cost, timestamp = take()
+                taken = min(remaining, held)
+                realized += taken * (price - cost)
+                remaining -= taken
+                if taken < held:
+                    put((lot_id, held - taken, cost, timestamp))
+        if lots:
+            self.lots[symbol] = lots
+        else:
+            self.lots.pop(symbol, None)
+        self.realized[symbol] = self.realized.get(symbol, 0.0) + realized
+        self.dirty.add(symbol)
+        return realized
+
+    def check_sell(self, symbol: str, quantity: int, method: str = LOT_METHOD, lot_ids: list[int] | None = None) -> None:
+        """ Raise ValueError if a sale couldn't be matched against the lots it would close. """
+        if method not in LOT_METHODS:
+            raise ValueError(f"Unknown lot method {method}; use one of {', '.join(LOT_METHODS)}")
+        lots = self.lots.get(symbol, ())
+        if lot_ids:
+            held = {lot[0]: lot[1] for lot in lots}
+            missing = [lot_id for lot_id in lot_ids if lot_id not in held]
+            if missing:
+                raise ValueError(f"No open lots of {symbol} with ids {missing}")
+            if len(set(lot_ids)) != len(lot_ids):
+                raise ValueError(f"Lot ids for {symbol} are repeated: {lot_ids}")
+            available = sum(held[lot_id] for lot_id in lot_ids)
+        elif method == SPECIFIC:
+            raise ValueError(f"Name the lots of {symbol} to sell; this account uses specific identification")
+        else:
+            available = sum(lot[1] for lot in lots)
+        if available < quantity:
+            raise ValueError(f"Cannot sell {quantity} shares of {symbol} from lots holding {available}.")
+
+    def subset(self, symbols) -> "LotBook":
+        """ A copy of just these symbols' lots, to try out a batch of orders on. """
+        return LotBook({symbol: list(self.lots.get(symbol, ())) for symbol in symbols})
+
+    def open_lots(self, symbol: str) -> list[tuple]:
+        return list(self.lots.get(symbol, ()))
+
+    def cost(self, symbol: str) -> float:
+        return sum(quantity * price for _, quantity, price, _ in self.lots.get(symbol, ()))
+
+    def unrealized(self, symbol: str, price: float) -> float:
+        return sum(quantity * (price - cost) for _, quantity, cost, _ in self.lots.get(symbol, ()))
+
+    def pnl(self, prices: dict[str, float]) -> dict[str, dict]:
+        """ Realized and unrealized P&L for every symbol that has either, marking open lots at prices. """
+        return {
+            symbol: {
+                "quantity": sum(lot[1] for lot in self.lots.get(symbol, ())),
+                "cost": self.cost(symbol),
+                "realized": self.realized.get(symbol, 0.0),
+                "unrealized": self.unrealized(symbol, prices.get(symbol, 0)) if symbol in self.lots else 0.0,
+            }
+            for symbol in sorted(self.lots.keys() | self.realized.keys())
+        }
+
+    def changes(self, symbols=None) -> dict[str, tuple[float, list[tuple]]]:
+        """ The state to save for the given symbols, or the dirty ones: (realized P&L, open lots) per symbol. """
+        symbols = self.dirty if symbols is None else symbols
+        return {symbol: (self.realized.get(symbol, 0.0), self.open_lots(symbol)) for symbol in symbols}
+
+    def mark_saved(self) -> None:
+        self.dirty.clear()
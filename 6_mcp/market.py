@@ -1,10 +1,16 @@
-from polygon import RESTClient
 from dotenv import load_dotenv
 import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
 from datetime import datetime
-import random
-from database import write_market, read_market
-from functools import lru_cache
+import clock
+from database import write_prices, has_prices, read_prices, read_market
+from market_provider import MarketProvider
+from simulated_market import SimulatedMarket
+from price_snapshot import PriceSnapshot, encode_key, snapshot_path, write_snapshot, remove_snapshots_before
+from polygon_client import get_client
 from datetime import timezone
 
 load_dotenv(override=True)
@@ -15,16 +21,169 @@ polygon_plan = os.getenv("POLYGON_PLAN")
 is_paid_polygon = polygon_plan == "paid"
 is_realtime_polygon = polygon_plan == "realtime"
 
+# Where prices come from: 'polygon', the default when there's an API key, or 'simulated'
+MARKET_PROVIDER = os.getenv("MARKET_PROVIDER", "polygon" if polygon_api_key else "simulated").strip().lower()
 
-def is_market_open() -> bool:
-    client = RESTClient(polygon_api_key)
+# Seconds a looked-up price is reused: realtime quotes go stale in seconds, the paid plan's
+# 15-minute delayed minute bars move once a minute, and end-of-day closes once a day
+PRICE_CACHE_TTL = float(
+    os.getenv("PRICE_CACHE_TTL", "5" if is_realtime_polygon else "60" if is_paid_polygon else "900")
+)
+PRICE_CACHE_SIZE = int(os.getenv("PRICE_CACHE_SIZE", "5000"))
+# On the paid plan, how often the whole market's prices are fetched in the background; 0 turns that off
+MARKET_REFRESH_SECONDS = float(os.getenv("MARKET_REFRESH_SECONDS", "60"))
+
+
+class PriceCache:
+    """
+    The prices this process has looked up recently, shared by every caller in it.
+
+    Traders, the researcher and the dashboard tend to ask for the same symbols within seconds of
+    each other, so each price is reused for ttl seconds after it was fetched. At most max_size
+    symbols are kept, evicting the least recently used.
+    """
+
+    def __init__(self, ttl: float = PRICE_CACHE_TTL, max_size: int = PRICE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # symbol -> (price, when it was fetched), least recently used first
+        self._prices: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def get_many(self, symbols: list[str]) -> dict[str, float]:
+        """Return the cached prices of whichever of symbols are still fresh, counting a hit or miss for each."""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for symbol in symbols:
+                entry = self._prices.get(symbol)
+                if entry is not None and now - entry[1] < self.ttl:
+                    self._prices.move_to_end(symbol)
+                    found[symbol] = entry[0]
+                    self.hits += 1
+                    continue
+                if entry is not None:
+                    del self._prices[symbol]
+                    self.expired += 1
+                self.misses += 1
+        return found
+
+    def put_many(self, prices: dict[str, float]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for symbol, price in prices.items():
+                self._prices[symbol] = (price, now)
+                self._prices.move_to_end(symbol)
+            while len(self._prices) > self.max_size:
+                self._prices.popitem(last=False)
+                self.evictions += 1
+
+    def fetch(self, symbols: list[str], lookup: Callable[[list[str]], dict[str, float]]) -> dict[str, float]:
+        """Return the prices of symbols, calling lookup once for just the ones not cached."""
+        prices = self.get_many(symbols)
+        missing = [symbol for symbol in symbols if symbol not in prices]
+        if missing:
+            fetched = lookup(missing)
+            self.put_many(fetched)
+            prices.update(fetched)
+        return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._prices.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "cached": len(self._prices),
+                "ttl": self.ttl,
+            }
+
+
+price_cache = PriceCache()
+
+
+class MarketSnapshot:
+    """
+    The latest price of every symbol in the market, refreshed in the background.
+
+    A thread started on first use calls fetch every interval seconds and swaps the map it returns in
+    whole, so a lookup is a dict access that never waits on the API or on a refresh in progress. If
+    refreshes keep failing, the map is no longer used once it is older than max_age seconds.
+    """
+
+    def __init__(self, fetch: Callable[[], dict[str, float]], interval: float, max_age: float | None = None):
+        self.fetch = fetch
+        self.interval = interval
+        self.max_age = max_age if max_age is not None else 3 * interval
+        self.refreshes = 0
+        self.failures = 0
+        # (prices, when they were fetched), replaced as one so readers see a consistent pair
+        self._snapshot: tuple[dict[str, float], float] = ({}, 0.0)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="market-snapshot", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.refresh()
+            time.sleep(self.interval)
+
+    def refresh(self) -> None:
+        try:
+            prices = self.fetch()
+        except Exception as e:
+            print(f"Was not able to refresh the market snapshot due to {e}")
+            self.failures += 1
+            return
+        self._snapshot = (prices, time.monotonic())
+        self.refreshes += 1
+
+    def get_many(self, symbols: list[str]) -> dict[str, float]:
+        """Return the snapshot's prices for whichever of symbols it has, if it is recent enough."""
+        self._ensure_started()
+        prices, fetched = self._snapshot
+        if time.monotonic() - fetched > self.max_age:
+            return {}
+        return {symbol: prices[symbol] for symbol in symbols if symbol in prices}
+
+    def stats(self) -> dict:
+        prices, fetched = self._snapshot
+        return {
+            "symbols": len(prices),
+            "age": time.monotonic() - fetched if fetched else None,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "interval": self.interval,
+        }
+
+
+def is_market_open_polygon() -> bool:
+    client = get_client()
     market_status = client.get_market_status()
     return market_status.market == "open"
 
 
 def get_all_share_prices_polygon_eod() -> dict[str, float]:
     """With much thanks to student Reema R. for fixing the timezone issue with this!"""
-    client = RESTClient(polygon_api_key)
+    client = get_client()
 
     probe = client.get_previous_close_agg("SPY")[0]
     last_close = datetime.fromtimestamp(probe.timestamp / 1000, tz=timezone.utc).date()
@@ -33,38 +192,157 @@ def get_all_share_prices_polygon_eod() -> dict[str, float]:
     return {result.ticker: result.close for result in results}
 
 
-@lru_cache(maxsize=2)
-def get_market_for_prior_date(today):
-    market_data = read_market(today)
-    if not market_data:
-        market_data = get_all_share_prices_polygon_eod()
-        write_market(today, market_data)
-    return market_data
+_snapshots: dict[str, PriceSnapshot] = {}
+_snapshots_lock = threading.Lock()
+
+
+def load_market_for_prior_date(today) -> PriceSnapshot:
+    """
+    Make sure the prior day's closing prices are in the prices table, fetching them if not, and return
+    them as a memory-mapped snapshot. The first process to need the day publishes the snapshot file;
+    the others just map it. Mapping a day closes the maps of earlier days, whose files are deleted,
+    so call this with _snapshots_lock held and only read the snapshot while still holding it.
+    """
+    snapshot = _snapshots.get(today)
+    if snapshot is not None:
+        return snapshot
+    path = snapshot_path(today)
+    if not os.path.exists(path):
+        if not has_prices(today):
+            write_prices(today, get_all_share_prices_polygon_eod())
+        write_snapshot(path, read_market(today) or {})
+        remove_snapshots_before(today)
+    snapshot = _snapshots[today] = PriceSnapshot(path)
+    for date in [date for date in _snapshots if date < today]:
+        _snapshots.pop(date).close()
+    return snapshot
+
+
+def read_prior_day_prices(today, symbols: list[str]) -> dict[str, float]:
+    """The prior day's closes of whichever of symbols the snapshot has, read before another thread can close it."""
+    with _snapshots_lock:
+        return load_market_for_prior_date(today).get_many(symbols)
 
 
 def get_share_price_polygon_eod(symbol) -> float:
-    today = datetime.now().date().strftime("%Y-%m-%d")
-    market_data = get_market_for_prior_date(today)
-    return market_data.get(symbol, 0.0)
+    return get_share_prices_polygon_eod([symbol])[symbol]
+
+
+def snapshot_price(result) -> float:
+    """The latest minute's close from a ticker snapshot, or the previous day's if it hasn't traded today."""
+    return (result.min and result.min.close) or (result.prev_day and result.prev_day.close) or 0.0
+
+
+def get_all_share_prices_polygon_min() -> dict[str, float]:
+    client = get_client()
+    return {result.ticker: snapshot_price(result) for result in client.get_snapshot_all("stocks")}
 
 
 def get_share_price_polygon_min(symbol) -> float:
-    client = RESTClient(polygon_api_key)
+    client = get_client()
     result = client.get_snapshot_ticker("stocks", symbol)
-    return result.min.close or result.prev_day.close
+    return snapshot_price(result)
+
+
+def get_share_prices_polygon_eod(symbols: list[str]) -> dict[str, float]:
+    today = clock.now().date().strftime("%Y-%m-%d")
+    prices = read_prior_day_prices(today, symbols)
+    # Symbols too long for the snapshot's keys are only in the prices table
+    missing = [symbol for symbol in symbols if symbol not in prices and encode_key(symbol) is None]
+    if missing:
+        prices.update(read_prices(today, missing))
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
+
+
+def get_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    client = get_client()
+    results = client.get_snapshot_all("stocks", tickers=list(symbols))
+    prices = {result.ticker: snapshot_price(result) for result in results}
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
+
+
+# Prices on the paid plan come from one whole-market snapshot per refresh, rather than a request per lookup
+market_snapshot = (
+    MarketSnapshot(get_all_share_prices_polygon_min, MARKET_REFRESH_SECONDS)
+    if polygon_api_key and is_paid_polygon and MARKET_REFRESH_SECONDS > 0
+    else None
+)
 
 
 def get_share_price_polygon(symbol) -> float:
+    if market_snapshot is not None:
+        price = market_snapshot.get_many([symbol]).get(symbol)
+        if price is not None:
+            return price
     if is_paid_polygon:
-        return get_share_price_polygon_min(symbol)
+        lookup = lambda symbols: {symbol: get_share_price_polygon_min(symbol)}
     else:
-        return get_share_price_polygon_eod(symbol)
+        lookup = lambda symbols: {symbol: get_share_price_polygon_eod(symbol)}
+    return price_cache.fetch([symbol], lookup)[symbol]
 
 
-def get_share_price(symbol) -> float:
-    if polygon_api_key:
+def get_share_prices_polygon(symbols: list[str]) -> dict[str, float]:
+    prices = market_snapshot.get_many(symbols) if market_snapshot is not None else {}
+    missing = [symbol for symbol in symbols if symbol not in prices]
+    if missing:
+        lookup = get_share_prices_polygon_min if is_paid_polygon else get_share_prices_polygon_eod
+        prices.update(price_cache.fetch(missing, lookup))
+    return {symbol: prices[symbol] for symbol in symbols}
+
+
+class PolygonMarket(MarketProvider):
+    """Prices from the Polygon API, falling back to a simulated market whenever the API can't be reached."""
+
+    def __init__(self, fallback: MarketProvider | None = None):
+        self.fallback = fallback or SimulatedMarket()
+
+    def get_share_price(self, symbol: str) -> float:
         try:
             return get_share_price_polygon(symbol)
         except Exception as e:
-            print(f"Was not able to use the polygon API due to {e}; using a random number")
-    return float(random.randint(1, 100))
+            print(f"Was not able to use the polygon API due to {e}; using a simulated price")
+        return self.fallback.get_share_price(symbol)
+
+    def get_share_prices(self, symbols: list[str]) -> dict[str, float]:
+        try:
+            return get_share_prices_polygon(symbols)
+        except Exception as e:
+            print(f"Was not able to use the polygon API due to {e}; using simulated prices")
+        return self.fallback.get_share_prices(symbols)
+
+    def is_market_open(self) -> bool:
+        return is_market_open_polygon()
+
+
+def create_provider(name: str = MARKET_PROVIDER) -> MarketProvider:
+    """Create the market data provider named by MARKET_PROVIDER: 'polygon' or 'simulated'."""
+    if name == "polygon":
+        return PolygonMarket()
+    elif name == "simulated":
+        return SimulatedMarket()
+    raise ValueError(f"Unknown market provider {name}")
+
+
+provider = create_provider()
+
+
+def use_provider(new_provider: MarketProvider) -> None:
+    """Route every price lookup in this module to a different provider from now on, such as a backtest's replay."""
+    global provider
+    provider = new_provider
+
+
+def is_market_open() -> bool:
+    return provider.is_market_open()
+
+
+def get_share_price(symbol) -> float:
+    return provider.get_share_price(symbol)
+
+
+def get_share_prices(symbols: list[str]) -> dict[str, float]:
+    """Look up the prices of several symbols at once: one snapshot request or one database query."""
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    return provider.get_share_prices(symbols)
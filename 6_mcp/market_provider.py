@@ -0,0 +1,18 @@
+from abc import ABC, abstractmethod
+
+
+class MarketProvider(ABC):
+    """
+    Where the trading floor gets share prices: the Polygon API, a simulated market or a replay of
+    stored history. market.py routes every lookup to the provider in use.
+    """
+
+    @abstractmethod
+    def get_share_prices(self, symbols: list[str]) -> dict[str, float]:
+        """Return the current price of each of symbols, with 0.0 for any symbol the market doesn't know."""
+
+    def get_share_price(self, symbol: str) -> float:
+        return self.get_share_prices([symbol]).get(symbol, 0.0)
+
+    def is_market_open(self) -> bool:
+        return True
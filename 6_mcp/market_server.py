@@ -1,5 +1,8 @@
+import json
 from mcp.server.fastmcp import FastMCP
-from market import get_share_price
+from market import get_share_price, get_share_prices, price_cache, market_snapshot
+from async_database import run_blocking
+import polygon_client
 
 mcp = FastMCP("market_server")
 
@@ -10,7 +13,28 @@ async def lookup_share_price(symbol: str) -> float:
     Args:
         symbol: the symbol of the stock
     """
-    return get_share_price(symbol)
+    return await run_blocking(get_share_price, symbol)
+
+@mcp.tool()
+async def lookup_share_prices(symbols: list[str]) -> dict[str, float]:
+    """This tool provides the current prices of several stock symbols in one call.
+
+    Args:
+        symbols: the symbols of the stocks
+    """
+    return await run_blocking(get_share_prices, symbols)
+
+@mcp.resource("market://price_cache_stats")
+async def read_price_cache_stats_resource() -> str:
+    return json.dumps(price_cache.stats())
+
+@mcp.resource("market://snapshot_stats")
+async def read_snapshot_stats_resource() -> str:
+    return json.dumps(market_snapshot.stats() if market_snapshot else {})
+
+@mcp.resource("market://polygon_client_stats")
+async def read_polygon_client_stats_resource() -> str:
+    return json.dumps(polygon_client.stats())
 
 if __name__ == "__main__":
     mcp.run(transport='stdio')
\ No newline at end of file
@@ -0,0 +1,195 @@
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import log_archive
+from ledger import Ledger
+import value_series
+from value_series import RAW, HOURLY, DAILY
+from storage import Storage, ConcurrentUpdateError, ACCOUNT_FIELDS, LOG_RETENTION_DAYS, LOG_RETENTION_ROWS
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class MemoryStorage(Storage):
+    """
+    Storage held entirely in this process's memory, for simulations, tests and benchmarks.
+
+    Nothing touches the disk (apart from logs rolled into the archive), and nothing is shared
+    with other processes, so MCP servers started as subprocesses each see their own empty store.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._accounts = {}
+        # Per name, (id, datetime, type, message) tuples in id order
+        self._logs = defaultdict(list)
+        self._last_log_id = 0
+        self._prices = defaultdict(dict)
+
+    def _check_version(self, name: str, expected_version: int) -> None:
+        account = self._accounts.get(name)
+        if account is None or account["version"] != expected_version:
+            raise ConcurrentUpdateError(f"Account {name} has changed since version {expected_version}")
+
+    def write_account(self, name, account_dict, expected_version=None):
+        name = name.lower()
+        with self._lock:
+            if expected_version is not None:
+                self._check_version(name, expected_version)
+            existing = self._accounts.get(name)
+            version = existing["version"] + (expected_version is not None) if existing else 0
+            cost_basis = account_dict.get("cost_basis", {})
+            values, rollups = [], {HOURLY: [], DAILY: []}
+            value_series.record(values, rollups, [tuple(v) for v in account_dict["portfolio_value_time_series"]])
+            self._accounts[name] = {
+                **{field: account_dict.get(field) for field in ACCOUNT_FIELDS},
+                "version": version,
+                "holdings": {symbol: (quantity, cost_basis.get(symbol)) for symbol, quantity in account_dict["holdings"].items()},
+                "transactions": [dict(t) for t in account_dict["transactions"]],
+                "portfolio_value_time_series": values,
+                "portfolio_value_rollups": rollups,
+                "lots": {symbol: list(symbol_lots) for symbol, symbol_lots in account_dict.get("lots", {}).items() if symbol_lots},
+                "lot_realized_pnl": dict(account_dict.get("lot_realized_pnl", {})),
+            }
+            return version
+
+    def create_account(self, name, account_dict):
+        name = name.lower()
+        with self._lock:
+            if name in self._accounts:
+                return False
+            self.write_account(name, account_dict)
+            return True
+
+    def update_account(self, name, expected_version, fields, holdings, transactions, portfolio_values, lots=None):
+        name = name.lower()
+        with self._lock:
+            self._check_version(name, expected_version)
+            account = self._accounts[name]
+            account["version"] += 1
+            account.update((field, fields[field]) for field in ACCOUNT_FIELDS if field in fields)
+            for symbol, (quantity, cost) in holdings.items():
+                if quantity:
+                    account["holdings"][symbol] = (quantity, cost)
+                else:
+                    account["holdings"].pop(symbol, None)
+            account["transactions"].extend(dict(t) for t in transactions)
+            for symbol, (realized, symbol_lots) in (lots or {}).items():
+                account["lot_realized_pnl"][symbol] = realized
+                if symbol_lots:
+                    account["lots"][symbol] = list(symbol_lots)
+                else:
+                    account["lots"].pop(symbol, None)
+            value_series.record(
+                account["portfolio_value_time_series"],
+                account["portfolio_value_rollups"],
+                [tuple(v) for v in portfolio_values],
+            )
+            return account["version"]
+
+    def read_account(self, name):
+        name = name.lower()
+        with self._lock:
+            account = self._accounts.get(name)
+            if account is None:
+                return None
+            return {
+                "name": name,
+                "version": account["version"],
+                **{field: account[field] for field in ACCOUNT_FIELDS},
+                "holdings": {symbol: quantity for symbol, (quantity, _) in account["holdings"].items()},
+                "cost_basis": {symbol: cost for symbol, (_, cost) in account["holdings"].items() if cost is not None},
+                "transactions": Ledger.from_transactions(account["transactions"]),
+                "portfolio_value_time_series": list(account["portfolio_value_time_series"]),
+                "lots": {symbol: list(symbol_lots) for symbol, symbol_lots in account["lots"].items()},
+                "lot_realized_pnl": dict(account["lot_realized_pnl"]),
+            }
+
+    def read_portfolio_values(self, name, resolution=RAW, since=None):
+        with self._lock:
+            account = self._accounts.get(name.lower())
+            if account is None:
+                return []
+            if resolution == RAW:
+                points = [(timestamp, value, value, value, value) for timestamp, value in account["portfolio_value_time_series"]]
+            else:
+                points = [tuple(b) for b in account["portfolio_value_rollups"][resolution]]
+        if since is not None:
+            start = value_series.bucket(since, resolution)
+            points = [point for point in points if point[0] >= start]
+        return points
+
+    def write_log(self, name, type, message):
+        self.write_logs([(name, _now(), type, message)])
+
+    def write_logs(self, entries):
+        with self._lock:
+            for name, timestamp, type, message in entries:
+                self._last_log_id += 1
+                self._logs[name.lower()].append((self._last_log_id, timestamp, type, message))
+
+    def read_log(self, name, last_n=10, since=None, until=None):
+        name = name.lower()
+        with self._lock:
+            logs = self._logs.get(name, [])
+            rows = []
+            for row in reversed(logs):
+                if len(rows) >= last_n:
+                    break
+                if (since is None or row[1] >= since) and (until is None or row[1] < until):
+                    rows.append(row)
+            rows.reverse()
+            oldest = logs[0][0] if logs else None
+        if since is not None and len(rows) < last_n:
+            archived = log_archive.read(name, since, until, before_id=oldest)
+            rows = archived[max(0, len(archived) - (last_n - len(rows))):] + rows
+        return [row[1:] for row in rows]
+
+    def read_log_since(self, name, after_id=0, last_n=-1):
+        with self._lock:
+            logs = self._logs.get(name.lower(), [])
+            start = bisect_right(logs, after_id, key=lambda row: row[0])
+            if last_n >= 0:
+                start = max(start, len(logs) - last_n)
+            return logs[start:]
+
+    def roll_logs(self, max_age_days=LOG_RETENTION_DAYS, max_rows=LOG_RETENTION_ROWS):
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            # Ids grow with time, so within each name the entries to expire are a prefix
+            keep_from = self._last_log_id - max_rows + 1
+            expired = []
+            for name, logs in self._logs.items():
+                end = max(bisect_left(logs, cutoff, key=lambda row: row[1]), bisect_left(logs, keep_from, key=lambda row: row[0]))
+                expired.extend((id, name, timestamp, type, message) for id, timestamp, type, message in logs[:end])
+                del logs[:end]
+        expired.sort()
+        if expired:
+            log_archive.append(expired)
+        return len(expired)
+
+    def write_prices(self, date, prices):
+        with self._lock:
+            self._prices[date].update((symbol, close) for symbol, close in prices.items() if close is not None)
+
+    def has_prices(self, date):
+        return bool(self._prices.get(date))
+
+    def read_price(self, date, symbol):
+        return self._prices.get(date, {}).get(symbol)
+
+    def read_prices(self, date, symbols):
+        prices = self._prices.get(date, {})
+        return {symbol: prices[symbol] for symbol in symbols if symbol in prices}
+
+    def read_market(self, date):
+        return dict(self._prices.get(date, {})) or None
+
+    def read_price_dates(self, since=None, until=None):
+        return sorted(
+            date for date, prices in self._prices.items()
+            if prices and (since is None or date >= since) and (until is None or date <= until)
+        )
@@ -0,0 +1,94 @@
+import os
+import threading
+import certifi
+import urllib3
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+from polygon import RESTClient
+
+load_dotenv(override=True)
+
+polygon_api_key = os.getenv("POLYGON_API_KEY")
+# Point at a local stand-in such as fake_polygon.py to try things out offline
+POLYGON_BASE_URL = os.getenv("POLYGON_BASE_URL", "https://api.polygon.io")
+POLYGON_CONNECT_TIMEOUT = float(os.getenv("POLYGON_CONNECT_TIMEOUT", "5"))
+POLYGON_READ_TIMEOUT = float(os.getenv("POLYGON_READ_TIMEOUT", "10"))
+POLYGON_RETRIES = int(os.getenv("POLYGON_RETRIES", "3"))
+# Retries wait backoff * 2^n seconds, plus up to jitter seconds at random so clients don't retry in step
+POLYGON_BACKOFF = float(os.getenv("POLYGON_BACKOFF", "0.2"))
+POLYGON_BACKOFF_JITTER = float(os.getenv("POLYGON_BACKOFF_JITTER", "0.2"))
+# Keep-alive connections held open per host, enough for the threads that look up prices at once
+POLYGON_POOL_SIZE = int(os.getenv("POLYGON_POOL_SIZE", "8"))
+
+RETRY_STATUSES = (413, 429, 499, 500, 502, 503, 504)
+
+
+class CountingRetry(Retry):
+    """A urllib3 retry policy that counts the retries it allows, for instrumentation."""
+
+    retried = 0
+    _lock = threading.Lock()
+
+    def increment(self, *args, **kwargs):
+        retry = super().increment(*args, **kwargs)
+        with CountingRetry._lock:
+            CountingRetry.retried += 1
+        return retry
+
+
+def create_client(base: str = POLYGON_BASE_URL, api_key: str | None = None) -> RESTClient:
+    """
+    Create a RESTClient whose connections are kept alive and reused, with timeouts and bounded,
+    jittered retries of failed connections and of the statuses Polygon uses for overload.
+    """
+    client = RESTClient(api_key or polygon_api_key, base=base, retries=POLYGON_RETRIES)
+    # RESTClient doesn't pass its timeouts on to its requests, and its pools only keep one
+    # connection per host alive, so give it a pool that does both
+    client.client = urllib3.PoolManager(
+        num_pools=4,
+        maxsize=POLYGON_POOL_SIZE,
+        headers=client.headers,
+        ca_certs=certifi.where(),
+        cert_reqs="CERT_REQUIRED",
+        timeout=urllib3.Timeout(connect=POLYGON_CONNECT_TIMEOUT, read=POLYGON_READ_TIMEOUT),
+        retries=CountingRetry(
+            total=POLYGON_RETRIES,
+            status_forcelist=RETRY_STATUSES,
+            backoff_factor=POLYGON_BACKOFF,
+            backoff_jitter=POLYGON_BACKOFF_JITTER,
+            respect_retry_after_header=True,
+        ),
+    )
+    return client
+
+
+_client: RESTClient | None = None
+_lock = threading.Lock()
+
+
+def get_client() -> RESTClient:
+    """The process's one Polygon client, created on first use and shared by every thread after that."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = create_client()
+    return _client
+
+
+def stats(client: RESTClient | None = None) -> dict:
+    """
+    How hard the client's connection pools have worked: requests made, connections opened to make them,
+    and so how many requests reused a kept-alive connection, plus the retries across all clients.
+    """
+    client = client or _client
+    pools = [client.client.pools[key] for key in client.client.pools.keys()] if client else []
+    requests = sum(pool.num_requests for pool in pools)
+    connections = sum(pool.num_connections for pool in pools)
+    return {
+        "requests": requests,
+        "connections": connections,
+        "reused": requests - connections,
+        "reuse_rate": (requests - connections) / requests if requests else 0.0,
+        "retries": CountingRetry.retried,
+    }
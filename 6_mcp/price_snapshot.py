@@ -0,0 +1,117 @@
+"""
+A day's closing prices published as a compact binary file that processes memory-map and share.
+
+The file is a header, then the symbols as fixed-width, NUL-padded ASCII keys in sorted order, then
+their prices as little-endian float64s in the same order:
+
+    magic b"PRCS" | version (uint32) | count (uint32) | key width (uint32)
+    count keys of key-width bytes
+    count float64 prices
+
+Opening one maps it rather than reading it, so every server process shares the one page-cached copy
+and starts with nothing to parse; a lookup is a binary search over the keys.
+"""
+
+import mmap
+import os
+import struct
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+PRICE_SNAPSHOT_DIR = os.getenv("PRICE_SNAPSHOT_DIR", "price_snapshots")
+MAGIC = b"PRCS"
+VERSION = 1
+KEY_WIDTH = 16
+HEADER = struct.Struct("<4sIII")
+PRICE = struct.Struct("<d")
+
+
+def snapshot_path(date: str, directory: str = PRICE_SNAPSHOT_DIR) -> str:
+    return os.path.join(directory, f"prices-{date}.bin")
+
+
+def encode_key(symbol: str) -> bytes | None:
+    """The symbol as a padded key, or None if it won't fit."""
+    try:
+        key = symbol.encode("ascii")
+    except UnicodeEncodeError:
+        return None
+    return key.ljust(KEY_WIDTH, b"\0") if len(key) <= KEY_WIDTH else None
+
+
+def write_snapshot(path: str, prices: dict[str, float]) -> int:
+    """
+    Publish prices to path, replacing any file there in one step so readers never see a partial one.
+    Symbols too long for a key are left out. Returns how many prices were written.
+    """
+    entries = sorted(
+        (key, price) for key, price in ((encode_key(symbol), price) for symbol, price in prices.items())
+        if key is not None and price is not None
+    )
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries), KEY_WIDTH))
+        f.write(b"".join(key for key, _ in entries))
+        f.write(struct.pack(f"<{len(entries)}d", *(price for _, price in entries)))
+    os.replace(temporary, path)
+    return len(entries)
+
+
+def remove_snapshots_before(date: str, directory: str = PRICE_SNAPSHOT_DIR) -> None:
+    """Delete the snapshot files of days before date; processes that still map one keep their copy."""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.startswith("prices-") and name.endswith(".bin") and name[7:-4] < date:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+class PriceSnapshot:
+    """A read-only, memory-mapped view of a snapshot file, looked up by binary search."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.key_width = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION or self.key_width != KEY_WIDTH:
+            raise ValueError(f"{path} is not a version {VERSION} price snapshot")
+        self._keys = HEADER.size
+        self._prices = self._keys + self.count * self.key_width
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get(self, symbol: str) -> float | None:
+        key = encode_key(symbol)
+        if key is None:
+            return None
+        width, keys = self.key_width, self._keys
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = keys + middle * width
+            probe = self._map[start:start + width]
+            if probe < key:
+                low = middle + 1
+            elif probe > key:
+                high = middle
+            else:
+                return PRICE.unpack_from(self._map, self._prices + middle * PRICE.size)[0]
+        return None
+
+    def get_many(self, symbols: list[str]) -> dict[str, float]:
+        """Return the prices of whichever of symbols the snapshot has."""
+        prices = {}
+        for symbol in symbols:
+            price = self.get(symbol)
+            if price is not None:
+                prices[symbol] = price
+        return prices
+
+    def close(self) -> None:
+        self._map.close()
@@ -0,0 +1,100 @@
+import hashlib
+import math
+import os
+import threading
+from datetime import datetime
+import numpy as np
+from dotenv import load_dotenv
+import clock
+from market_provider import MarketProvider
+
+load_dotenv(override=True)
+
+SIMULATED_MARKET_SEED = int(os.getenv("SIMULATED_MARKET_SEED", "42"))
+# Annualised drift and volatility of every symbol's geometric Brownian motion
+SIMULATED_DRIFT = float(os.getenv("SIMULATED_DRIFT", "0.05"))
+SIMULATED_VOLATILITY = float(os.getenv("SIMULATED_VOLATILITY", "0.3"))
+# Prices move once per step, starting from each symbol's opening price at the origin
+SIMULATED_STEP_SECONDS = float(os.getenv("SIMULATED_STEP_SECONDS", "60"))
+SIMULATED_MARKET_ORIGIN = os.getenv("SIMULATED_MARKET_ORIGIN", "2025-01-01")
+
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+# Steps per independently generated stretch of a symbol's random walk
+BLOCK = 4096
+
+
+class SimulatedMarket(MarketProvider):
+    """
+    A stock market where each symbol follows its own geometric Brownian motion.
+
+    A price is a pure function of the seed, the symbol and the time on the clock, so every process,
+    and every rerun with the same seed, sees the same price for a symbol at the same moment; nothing
+    is shared between processes but the settings. Each symbol's random walk is generated in blocks
+    of BLOCK steps: the walk's value at each block boundary comes from its own seeded draw, and the
+    steps within a block are a Brownian bridge between its two boundaries. So a price at any time
+    costs at most one block's worth of draws, whichever order the times are asked for in.
+    """
+
+    def __init__(
+        self,
+        seed: int = SIMULATED_MARKET_SEED,
+        drift: float = SIMULATED_DRIFT,
+        volatility: float = SIMULATED_VOLATILITY,
+        step_seconds: float = SIMULATED_STEP_SECONDS,
+        origin: str = SIMULATED_MARKET_ORIGIN,
+    ):
+        self.seed = seed
+        self.drift = drift
+        self.volatility = volatility
+        self.step_seconds = step_seconds
+        self.origin = datetime.fromisoformat(origin)
+        self._lock = threading.Lock()
+        # Per symbol, the walk's value at the start of each block generated so far
+        self._boundaries: dict[str, list[float]] = {}
+        # Per symbol, the most recently used block and the walk's values through it
+        self._blocks: dict[str, tuple[int, np.ndarray]] = {}
+        self._opening_prices: dict[str, float] = {}
+
+    def _rng(self, symbol: str, *path: int) -> np.random.Generator:
+        key = int.from_bytes(hashlib.sha256(symbol.encode()).digest()[:8], "little")
+        return np.random.default_rng([self.seed, key, *path])
+
+    def opening_price(self, symbol: str) -> float:
+        """The symbol's price at the origin, spread evenly in log terms between $10 and $500."""
+        price = self._opening_prices.get(symbol)
+        if price is None:
+            price = self._opening_prices[symbol] = math.exp(self._rng(symbol, 0).uniform(math.log(10), math.log(500)))
+        return price
+
+    def _walk(self, symbol: str, step: int) -> float:
+        """The symbol's standard random walk after step steps."""
+        block, offset = divmod(step, BLOCK)
+        with self._lock:
+            boundaries = self._boundaries.setdefault(symbol, [0.0])
+            while len(boundaries) < block + 2:
+                index = len(boundaries) - 1
+                boundaries.append(boundaries[-1] + self._rng(symbol, 1, index).standard_normal() * math.sqrt(BLOCK))
+            if offset == 0:
+                return boundaries[block]
+            cached = self._blocks.get(symbol)
+            if cached is None or cached[0] != block:
+                walk = np.cumsum(self._rng(symbol, 2, block).standard_normal(BLOCK))
+                # Pin the walk to the next boundary, making it a Brownian bridge across the block
+                walk -= np.arange(1, BLOCK + 1) / BLOCK * (walk[-1] - (boundaries[block + 1] - boundaries[block]))
+                cached = self._blocks[symbol] = (block, boundaries[block] + walk)
+            return float(cached[1][offset - 1])
+
+    def price_at(self, symbol: str, when: datetime) -> float:
+        step = max(0, int((when - self.origin).total_seconds() // self.step_seconds))
+        dt = self.step_seconds / SECONDS_PER_YEAR
+        log_return = (self.drift - self.volatility ** 2 / 2) * step * dt + self.volatility * math.sqrt(dt) * self._walk(symbol, step)
+        return round(self.opening_price(symbol) * math.exp(log_return), 2)
+
+    def get_share_prices(self, symbols: list[str]) -> dict[str, float]:
+        now = clock.now()
+        return {symbol: self.price_at(symbol, now) for symbol in symbols}
+
+    def is_market_open(self) -> bool:
+        """Open on weekdays from 9:30 to 16:00 by the clock, like the real market without its holidays."""
+        now = clock.now()
+        return now.weekday() < 5 and (9, 30) <= (now.hour, now.minute) < (16, 0)
@@ -0,0 +1,503 @@
+import sqlite3
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+import log_archive
+from ledger import Ledger
+import value_series
+from value_series import RAW, HOURLY, DAILY
+from storage import Storage, ConcurrentUpdateError, ACCOUNT_FIELDS, LOG_RETENTION_DAYS, LOG_RETENTION_ROWS
+
+BUSY_TIMEOUT_MS = 5000
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> list[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _insert_account(conn: sqlite3.Connection, name: str, account_dict: dict) -> None:
+    conn.execute(f'''
+        INSERT INTO accounts (name, {", ".join(ACCOUNT_FIELDS)})
+        VALUES (?, {", ".join("?" * len(ACCOUNT_FIELDS))})
+        ON CONFLICT(name) DO UPDATE SET {", ".join(f"{field}=excluded.{field}" for field in ACCOUNT_FIELDS)}
+    ''', (name, *(account_dict.get(field) for field in ACCOUNT_FIELDS)))
+    for table in ("holdings", "transactions", "portfolio_values", "portfolio_rollups", "lots", "lot_pnl"):
+        conn.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+    cost_basis = account_dict.get("cost_basis", {})
+    conn.executemany(
+        "INSERT INTO holdings (name, symbol, quantity, cost) VALUES (?, ?, ?, ?)",
+        [(name, symbol, quantity, cost_basis.get(symbol)) for symbol, quantity in account_dict["holdings"].items()],
+    )
+    _insert_transactions(conn, name, account_dict["transactions"])
+    _insert_portfolio_values(conn, name, account_dict["portfolio_value_time_series"])
+    realized = account_dict.get("lot_realized_pnl", {})
+    lots = account_dict.get("lots", {})
+    _replace_lots(conn, name, {
+        symbol: (realized.get(symbol, 0.0), lots.get(symbol, [])) for symbol in realized.keys() | lots.keys()
+    })
+
+
+def _replace_lots(conn: sqlite3.Connection, name: str, lots: dict[str, tuple[float, list[tuple]]]) -> None:
+    """Replace the open lots and realized P&L of each symbol in lots."""
+    for symbol, (realized, symbol_lots) in lots.items():
+        conn.execute("DELETE FROM lots WHERE name = ? AND symbol = ?", (name, symbol))
+        conn.executemany(
+            "INSERT INTO lots (name, symbol, lot_id, quantity, price, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+            [(name, symbol, *lot) for lot in symbol_lots],
+        )
+        conn.execute('''
+            INSERT INTO lot_pnl (name, symbol, realized) VALUES (?, ?, ?)
+            ON CONFLICT(name, symbol) DO UPDATE SET realized=excluded.realized
+        ''', (name, symbol, realized))
+
+
+def _insert_prices(conn: sqlite3.Connection, date: str, prices: dict[str, float]) -> None:
+    conn.executemany('''
+        INSERT INTO prices (date, symbol, close)
+        VALUES (?, ?, ?)
+        ON CONFLICT(date, symbol) DO UPDATE SET close=excluded.close
+    ''', [(date, symbol, close) for symbol, close in prices.items() if close is not None])
+
+
+def _insert_transactions(conn: sqlite3.Connection, name: str, transactions: list[dict]) -> None:
+    conn.executemany('''
+        INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"]) for t in transactions])
+
+
+def _insert_portfolio_values(conn: sqlite3.Connection, name: str, values: list) -> None:
+    conn.executemany(
+        "INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)",
+        [(name, timestamp, value) for timestamp, value in values],
+    )
+    _roll_up_portfolio_values(conn, name, values)
+
+
+def _roll_up_portfolio_values(conn: sqlite3.Connection, name: str, values: list) -> None:
+    """Fold new points into the hourly and daily rollups, then expire whatever has passed retention."""
+    if not values:
+        return
+    for resolution in (HOURLY, DAILY):
+        buckets = []
+        for timestamp, value in values:
+            value_series.roll_up(buckets, resolution, timestamp, value)
+        conn.executemany('''
+            INSERT INTO portfolio_rollups (name, resolution, bucket, open, high, low, close)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name, resolution, bucket) DO UPDATE SET
+                high=max(high, excluded.high), low=min(low, excluded.low), close=excluded.close
+        ''', [(name, resolution, *b) for b in buckets])
+    limits = value_series.cutoffs(max(timestamp for timestamp, _ in values))
+    conn.execute("DELETE FROM portfolio_values WHERE name = ? AND datetime < ?", (name, limits[RAW]))
+    for resolution in (HOURLY, DAILY):
+        conn.execute(
+            "DELETE FROM portfolio_rollups WHERE name = ? AND resolution = ? AND bucket < ?",
+            (name, resolution, limits[resolution]),
+        )
+
+
+def _bump_version(conn: sqlite3.Connection, name: str, expected_version: int) -> int:
+    cursor = conn.execute(
+        "UPDATE accounts SET version = version + 1 WHERE name = ? AND version = ?", (name, expected_version)
+    )
+    if cursor.rowcount == 0:
+        raise ConcurrentUpdateError(f"Account {name} has changed since version {expected_version}")
+    return expected_version + 1
+
+
+class SQLiteStorage(Storage):
+    """Storage in a single SQLite database file, shared by every process on the trading floor."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._create_schema()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Return the connection for the current thread, opening it on first use.
+
+        Connections are kept open for the life of the thread, so each call reuses the same
+        handle instead of paying for a fresh connect. A forked child process gets its own.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000)
+            # Only takes effect on a new database; roll_logs converts an existing one
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self) -> None:
+        """Close the current thread's connection, if it has one."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _create_schema(self) -> None:
+        with self.connect() as conn:
+            # Accounts used to be stored as a single JSON blob per name; migrate those in place
+            conn.execute("BEGIN")
+            legacy = "account" in _columns(conn, "accounts")
+            if legacy:
+                conn.execute("ALTER TABLE accounts RENAME TO accounts_json")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS accounts (
+                    name TEXT PRIMARY KEY,
+                    balance REAL NOT NULL,
+                    strategy TEXT NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    net_spend REAL,
+                    realized_pnl REAL,
+                    lot_method TEXT
+                )
+            ''')
+            if "version" not in _columns(conn, "accounts"):
+                conn.execute("ALTER TABLE accounts ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            # Running P&L columns are left NULL on existing rows, and rebuilt from the ledger on load
+            for column in ("net_spend", "realized_pnl"):
+                if column not in _columns(conn, "accounts"):
+                    conn.execute(f"ALTER TABLE accounts ADD COLUMN {column} REAL")
+            # Likewise lot_method is left NULL, and the lots are rebuilt from the ledger on load
+            if "lot_method" not in _columns(conn, "accounts"):
+                conn.execute("ALTER TABLE accounts ADD COLUMN lot_method TEXT")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS holdings (
+                    name TEXT NOT NULL,
+                    symbol TEXT NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    cost REAL,
+                    PRIMARY KEY (name, symbol)
+                )
+            ''')
+            if "cost" not in _columns(conn, "holdings"):
+                conn.execute("ALTER TABLE holdings ADD COLUMN cost REAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS transactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    symbol TEXT NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    price REAL NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    rationale TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS transactions_name_id ON transactions (name, id)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS portfolio_values (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    datetime TEXT NOT NULL,
+                    value REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS portfolio_values_name_id ON portfolio_values (name, id)')
+            unrolled = not _columns(conn, "portfolio_rollups")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS portfolio_rollups (
+                    name TEXT NOT NULL,
+                    resolution TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    open REAL NOT NULL,
+                    high REAL NOT NULL,
+                    low REAL NOT NULL,
+                    close REAL NOT NULL,
+                    PRIMARY KEY (name, resolution, bucket)
+                ) WITHOUT ROWID
+            ''')
+            # Portfolio values used to be kept forever at full resolution; roll those up and expire them
+            if unrolled:
+                names = [row[0] for row in conn.execute("SELECT DISTINCT name FROM portfolio_values").fetchall()]
+                for name in names:
+                    values = conn.execute(
+                        "SELECT datetime, value FROM portfolio_values WHERE name = ? ORDER BY id", (name,)
+                    ).fetchall()
+                    _roll_up_portfolio_values(conn, name, values)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS lots (
+                    name TEXT NOT NULL,
+                    symbol TEXT NOT NULL,
+                    lot_id INTEGER NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    price REAL NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    PRIMARY KEY (name, symbol, lot_id)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS lot_pnl (
+                    name TEXT NOT NULL,
+                    symbol TEXT NOT NULL,
+                    realized REAL NOT NULL,
+                    PRIMARY KEY (name, symbol)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT,
+                    datetime DATETIME,
+                    type TEXT,
+                    message TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS logs_name_id ON logs (name, id)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS prices (
+                    date TEXT NOT NULL,
+                    symbol TEXT NOT NULL,
+                    close REAL NOT NULL,
+                    PRIMARY KEY (date, symbol)
+                ) WITHOUT ROWID
+            ''')
+            if legacy:
+                for name, account in conn.execute("SELECT name, account FROM accounts_json").fetchall():
+                    _insert_account(conn, name, json.loads(account))
+                conn.execute("DROP TABLE accounts_json")
+            # Market data used to be stored as one JSON blob per date; split those into prices rows
+            if _columns(conn, "market"):
+                for date, data in conn.execute("SELECT date, data FROM market").fetchall():
+                    _insert_prices(conn, date, json.loads(data))
+                conn.execute("DROP TABLE market")
+
+    def write_account(self, name, account_dict, expected_version=None):
+        name = name.lower()
+        with self.connect() as conn:
+            if expected_version is not None:
+                _bump_version(conn, name, expected_version)
+            _insert_account(conn, name, account_dict)
+            return conn.execute("SELECT version FROM accounts WHERE name = ?", (name,)).fetchone()[0]
+
+    def create_account(self, name, account_dict):
+        name = name.lower()
+        with self.connect() as conn:
+            # Claim the name first, so a concurrent create can't replace an account another process made
+            cursor = conn.execute(
+                f"INSERT INTO accounts (name, {', '.join(ACCOUNT_FIELDS)}) VALUES (?, {', '.join('?' * len(ACCOUNT_FIELDS))}) "
+                "ON CONFLICT(name) DO NOTHING",
+                (name, *(account_dict.get(field) for field in ACCOUNT_FIELDS)),
+            )
+            if cursor.rowcount == 0:
+                return False
+            _insert_account(conn, name, account_dict)
+            return True
+
+    def update_account(self, name, expected_version, fields, holdings, transactions, portfolio_values, lots=None):
+        name = name.lower()
+        columns = [field for field in ACCOUNT_FIELDS if field in fields]
+        with self.connect() as conn:
+            version = _bump_version(conn, name, expected_version)
+            if columns:
+                conn.execute(
+                    f"UPDATE accounts SET {', '.join(f'{column} = ?' for column in columns)} WHERE name = ?",
+                    (*(fields[column] for column in columns), name),
+                )
+            for symbol, (quantity, cost) in holdings.items():
+                if quantity:
+                    conn.execute('''
+                        INSERT INTO holdings (name, symbol, quantity, cost)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(name, symbol) DO UPDATE SET quantity=excluded.quantity, cost=excluded.cost
+                    ''', (name, symbol, quantity, cost))
+                else:
+                    conn.execute("DELETE FROM holdings WHERE name = ? AND symbol = ?", (name, symbol))
+            _insert_transactions(conn, name, transactions)
+            _insert_portfolio_values(conn, name, portfolio_values)
+            _replace_lots(conn, name, lots or {})
+        return version
+
+    def read_account(self, name):
+        name = name.lower()
+        with self.connect() as conn:
+            # Read every table from one snapshot, so a concurrent save can't be seen half applied
+            conn.execute("BEGIN")
+            row = conn.execute(
+                f"SELECT version, {', '.join(ACCOUNT_FIELDS)} FROM accounts WHERE name = ?", (name,)
+            ).fetchone()
+            if not row:
+                return None
+            holdings = conn.execute("SELECT symbol, quantity, cost FROM holdings WHERE name = ?", (name,)).fetchall()
+            transactions = conn.execute('''
+                SELECT id, symbol, quantity, price, timestamp FROM transactions
+                WHERE name = ?
+                ORDER BY id
+            ''', (name,)).fetchall()
+            values = conn.execute(
+                "SELECT datetime, value FROM portfolio_values WHERE name = ? ORDER BY id", (name,)
+            ).fetchall()
+            lots = {}
+            for symbol, lot_id, quantity, price, timestamp in conn.execute(
+                "SELECT symbol, lot_id, quantity, price, timestamp FROM lots WHERE name = ? ORDER BY symbol, lot_id", (name,)
+            ):
+                lots.setdefault(symbol, []).append((lot_id, quantity, price, timestamp))
+            realized = conn.execute("SELECT symbol, realized FROM lot_pnl WHERE name = ?", (name,)).fetchall()
+        return {
+            "name": name,
+            "version": row[0],
+            **dict(zip(ACCOUNT_FIELDS, row[1:])),
+            "holdings": {symbol: quantity for symbol, quantity, _ in holdings},
+            "cost_basis": {symbol: cost for symbol, _, cost in holdings if cost is not None},
+            "transactions": Ledger.from_rows(
+                [transaction[1:] for transaction in transactions],
+                load_rationales=self._rationale_loader(name, transactions[0][0], transactions[-1][0], len(transactions))
+                if transactions else None,
+            ),
+            "portfolio_value_time_series": values,
+            "lots": lots,
+            "lot_realized_pnl": dict(realized),
+        }
+
+    def read_portfolio_values(self, name, resolution=RAW, since=None):
+        start = value_series.bucket(since, resolution) if since is not None else ""
+        if resolution == RAW:
+            cursor = self.connect().execute('''
+                SELECT datetime, value, value, value, value FROM portfolio_values
+                WHERE name = ? AND datetime >= ?
+                ORDER BY id
+            ''', (name.lower(), start))
+        else:
+            cursor = self.connect().execute('''
+                SELECT bucket, open, high, low, close FROM portfolio_rollups
+                WHERE name = ? AND resolution = ? AND bucket >= ?
+                ORDER BY bucket
+            ''', (name.lower(), resolution, start))
+        return cursor.fetchall()
+
+    def _rationale_loader(self, name: str, first_id: int, last_id: int, count: int):
+        """
+        Return a function that fetches the rationales of the count transactions read, by their ids.
+
+        Ids only ever grow, so if the ledger has been rewritten since it was read, fewer rows are left
+        in that range; rather than pair the ledger with another one's text, that raises ConcurrentUpdateError.
+        """
+        def load() -> list[str]:
+            rationales = [row[0] for row in self.connect().execute(
+                "SELECT rationale FROM transactions WHERE name = ? AND id BETWEEN ? AND ? ORDER BY id",
+                (name, first_id, last_id),
+            )]
+            if len(rationales) != count:
+                raise ConcurrentUpdateError(f"The transactions of account {name} were rewritten before their rationales were read")
+            return rationales
+        return load
+
+    def write_log(self, name, type, message):
+        with self.connect() as conn:
+            conn.execute('''
+                INSERT INTO logs (name, datetime, type, message)
+                VALUES (?, datetime('now'), ?, ?)
+            ''', (name.lower(), type, message))
+
+    def write_logs(self, entries):
+        with self.connect() as conn:
+            conn.executemany('''
+                INSERT INTO logs (name, datetime, type, message)
+                VALUES (?, ?, ?, ?)
+            ''', [(name.lower(), timestamp, type, message) for name, timestamp, type, message in entries])
+
+    def read_log(self, name, last_n=10, since=None, until=None):
+        name = name.lower()
+        conn = self.connect()
+        conditions, params = ["name = ?"], [name]
+        if since is not None:
+            conditions.append("datetime >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("datetime < ?")
+            params.append(until)
+        cursor = conn.execute(f'''
+            SELECT id, datetime, type, message FROM logs
+            WHERE {" AND ".join(conditions)}
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (*params, last_n))
+        rows = cursor.fetchall()[::-1]
+        if since is not None and len(rows) < last_n:
+            oldest = conn.execute("SELECT id FROM logs WHERE name = ? ORDER BY id LIMIT 1", (name,)).fetchone()
+            archived = log_archive.read(name, since, until, before_id=oldest[0] if oldest else None)
+            rows = archived[max(0, len(archived) - (last_n - len(rows))):] + rows
+        return [row[1:] for row in rows]
+
+    def read_log_since(self, name, after_id=0, last_n=-1):
+        cursor = self.connect().execute('''
+            SELECT id, datetime, type, message FROM logs
+            WHERE name = ? AND id > ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (name.lower(), after_id, last_n))
+        return cursor.fetchall()[::-1]
+
+    def roll_logs(self, max_age_days=LOG_RETENTION_DAYS, max_rows=LOG_RETENTION_ROWS, chunk: int = 50_000):
+        conn = self.connect()
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        # Ids grow with time, so the entries to expire are a prefix of the table in id order
+        first_recent = conn.execute(
+            "SELECT id FROM logs WHERE datetime >= ? ORDER BY id LIMIT 1", (cutoff,)
+        ).fetchone()
+        last_id = conn.execute("SELECT max(id) FROM logs").fetchone()[0] or 0
+        keep_from = max(first_recent[0] if first_recent else last_id + 1, last_id - max_rows + 1)
+        archived = 0
+        while True:
+            rows = conn.execute('''
+                SELECT id, name, datetime, type, message FROM logs
+                WHERE id < ?
+                ORDER BY id
+                LIMIT ?
+            ''', (keep_from, chunk)).fetchall()
+            if not rows:
+                break
+            log_archive.append(rows)
+            with conn:
+                conn.execute("DELETE FROM logs WHERE id <= ?", (rows[-1][0],))
+            archived += len(rows)
+        # Return the freed pages to the filesystem
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0:
+            conn.execute("VACUUM")
+        else:
+            conn.execute("PRAGMA incremental_vacuum")
+        return archived
+
+    def write_prices(self, date, prices):
+        with self.connect() as conn:
+            _insert_prices(conn, date, prices)
+
+    def has_prices(self, date):
+        return self.connect().execute('SELECT 1 FROM prices WHERE date = ? LIMIT 1', (date,)).fetchone() is not None
+
+    def read_price(self, date, symbol):
+        row = self.connect().execute(
+            'SELECT close FROM prices WHERE date = ? AND symbol = ?', (date, symbol)
+        ).fetchone()
+        return row[0] if row else None
+
+    def read_prices(self, date, symbols):
+        symbols = list(set(symbols))
+        results = {}
+        conn = self.connect()
+        # Stay under SQLite's limit on the number of bound parameters
+        for start in range(0, len(symbols), 500):
+            batch = symbols[start:start + 500]
+            cursor = conn.execute(
+                f'SELECT symbol, close FROM prices WHERE date = ? AND symbol IN ({", ".join("?" * len(batch))})',
+                (date, *batch),
+            )
+            results.update(cursor.fetchall())
+        return results
+
+    def read_market(self, date):
+        cursor = self.connect().execute('SELECT symbol, close FROM prices WHERE date = ?', (date,))
+        return dict(cursor.fetchall()) or None
+
+    def read_price_dates(self, since=None, until=None):
+        cursor = self.connect().execute(
+            'SELECT DISTINCT date FROM prices WHERE date >= ? AND date <= ? ORDER BY date',
+            (since or "", until or "9999-12-31"),
+        )
+        return [row[0] for row in cursor.fetchall()]
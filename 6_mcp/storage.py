@@ -0,0 +1,192 @@
+from abc import ABC, abstractmethod
+import os
+from dotenv import load_dotenv
+from value_series import RAW
+
+load_dotenv(override=True)
+
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "7"))
+LOG_RETENTION_ROWS = int(os.getenv("LOG_RETENTION_ROWS", "1000000"))
+
+
+# The scalar fields of an account, besides its name and version
+ACCOUNT_FIELDS = ("balance", "strategy", "net_spend", "realized_pnl", "lot_method")
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when an account was changed by someone else since it was read."""
+
+
+class Storage(ABC):
+    """
+    Everything the trading floor persists: accounts, logs and market prices.
+
+    database.py exposes the selected implementation as module-level functions, so callers
+    never deal with a Storage directly.
+    """
+
+    @abstractmethod
+    def write_account(self, name: str, account_dict: dict, expected_version: int | None = None) -> int:
+        """
+        Replace everything stored for an account with the contents of account_dict.
+
+        If expected_version is given, the write only happens if the stored account is still at that
+        version; otherwise ConcurrentUpdateError is raised. Returns the account's new version.
+        """
+
+    @abstractmethod
+    def create_account(self, name: str, account_dict: dict) -> bool:
+        """
+        Store a new account with the contents of account_dict, unless one of that name already exists,
+        in which case nothing changes. Returns whether it was created.
+        """
+
+    @abstractmethod
+    def update_account(
+        self,
+        name: str,
+        expected_version: int,
+        fields: dict,
+        holdings: dict[str, tuple[int, float]],
+        transactions: list[dict],
+        portfolio_values: list[tuple[str, float]],
+        lots: dict[str, tuple[float, list[tuple]]] | None = None,
+    ) -> int:
+        """
+        Apply an incremental change to an account in a single transaction.
+
+        The change is a compare-and-swap on the account's version: if someone else has saved the
+        account since it was read, nothing is written and ConcurrentUpdateError is raised.
+
+        Args:
+            name (str): The account name
+            expected_version (int): The version the account was at when it was read
+            fields (dict): New values for the account's scalar fields, keyed by ACCOUNT_FIELDS
+            holdings (dict): Only the symbols whose position changed, as (quantity, cost basis);
+                a quantity of 0 removes the holding
+            transactions (list): New transactions to append to the ledger
+            portfolio_values (list): New (datetime, value) points to append to the time series, which
+                also rolls them up and expires whatever has passed retention
+            lots (dict): Only the symbols whose lots changed, as (realized P&L, open lots), each lot
+                being (lot_id, quantity, price, timestamp); the open lots replace the stored ones
+
+        Returns:
+            int: The account's new version
+        """
+
+    @abstractmethod
+    def read_account(self, name: str) -> dict | None:
+        """
+        Read an account as a dict of its fields plus its current version, or None if it doesn't exist.
+
+        net_spend and realized_pnl are None, and cost_basis is incomplete, for accounts saved before
+        running P&L was tracked; the caller rebuilds them from the transactions.
+        portfolio_value_time_series only holds the raw points still within retention, and transactions
+        is a Ledger, which may fetch its rationale text from storage on first use; that raises
+        ConcurrentUpdateError if the ledger has been rewritten since. lots maps each symbol to its open
+        lots and lot_realized_pnl to the P&L realized against its lots; lot_method is None for accounts
+        saved before lots were tracked.
+        """
+
+    @abstractmethod
+    def read_portfolio_values(self, name: str, resolution: str = RAW, since: str | None = None) -> list:
+        """
+        Read an account's portfolio value history at one resolution.
+
+        Args:
+            name (str): The account name
+            resolution (str): RAW for every point recorded over the last day, or HOURLY or DAILY
+                for the rollups kept over longer windows (see value_series)
+            since (str): If given, only the points, or buckets, that end at or after this datetime
+
+        Returns:
+            list: Tuples of (datetime, open, high, low, close), oldest first; for RAW points all
+            four values are the same
+        """
+
+    @abstractmethod
+    def write_log(self, name: str, type: str, message: str) -> None:
+        """
+        Write a log entry, timestamped now.
+
+        Args:
+            name (str): The name associated with the log
+            type (str): The type of log entry
+            message (str): The log message
+        """
+
+    @abstractmethod
+    def write_logs(self, entries: list[tuple[str, str, str, str]]) -> None:
+        """
+        Write a batch of log entries in one transaction.
+
+        Args:
+            entries (list): Tuples of (name, datetime, type, message), with datetime in UTC
+        """
+
+    @abstractmethod
+    def read_log(self, name: str, last_n=10, since: str | None = None, until: str | None = None) -> list:
+        """
+        Read the most recent log entries for a given name.
+
+        Args:
+            name (str): The name to retrieve logs for
+            last_n (int): Number of most recent entries to retrieve
+            since (str): If given, only entries at or after this UTC datetime ('YYYY-MM-DD HH:MM:SS');
+                entries that have been rolled out of storage are read back from the archive
+            until (str): If given, only entries before this UTC datetime
+
+        Returns:
+            list: A list of tuples containing (datetime, type, message)
+        """
+
+    @abstractmethod
+    def read_log_since(self, name: str, after_id: int = 0, last_n: int = -1) -> list:
+        """
+        Read the log entries for a given name that were written after a cursor.
+
+        Args:
+            name (str): The name to retrieve logs for
+            after_id (int): Only return entries with an id greater than this
+            last_n (int): If positive, return at most this many of the newest matching entries
+
+        Returns:
+            list: A list of tuples containing (id, datetime, type, message), oldest first;
+            pass the last id back as after_id to continue from there
+        """
+
+    @abstractmethod
+    def roll_logs(self, max_age_days: int = LOG_RETENTION_DAYS, max_rows: int = LOG_RETENTION_ROWS) -> int:
+        """
+        Move old log entries out of storage into the compressed per-day archive.
+
+        Entries older than max_age_days are archived, as are the oldest entries beyond the newest
+        max_rows.
+
+        Returns:
+            int: The number of entries archived
+        """
+
+    @abstractmethod
+    def write_prices(self, date: str, prices: dict[str, float]) -> None:
+        """Store the closing price of every symbol in prices for the given date."""
+
+    @abstractmethod
+    def has_prices(self, date: str) -> bool:
+        """Return whether any closing prices are stored for the given date."""
+
+    @abstractmethod
+    def read_price(self, date: str, symbol: str) -> float | None:
+        """Return the closing price of symbol on the given date, or None if it isn't known."""
+
+    @abstractmethod
+    def read_prices(self, date: str, symbols: list[str]) -> dict[str, float]:
+        """Return the closing prices for the given date of whichever of symbols are known."""
+
+    @abstractmethod
+    def read_market(self, date: str) -> dict[str, float] | None:
+        """Return every closing price stored for the given date, or None if there are none."""
+
+    @abstractmethod
+    def read_price_dates(self, since: str | None = None, until: str | None = None) -> list[str]:
+        """Return the dates with closing prices stored, oldest first, from since up to and including until."""
@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The trading floor's modules are run from 6_mcp and import each other by bare name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep the default database, opened on import, out of the working directory
+os.environ["ACCOUNTS_DB"] = os.path.join(tempfile.mkdtemp(), "accounts.db")
+
+import database
+import market
+from market_provider import MarketProvider
+from sqlite_storage import SQLiteStorage
+
+
+class FixedMarket(MarketProvider):
+    """Prices that only change when a test sets them."""
+
+    def __init__(self, prices: dict[str, float]):
+        self.prices = prices
+
+    def get_share_prices(self, symbols: list[str]) -> dict[str, float]:
+        return {symbol: self.prices.get(symbol, 0.0) for symbol in symbols}
+
+
+@pytest.fixture
+def prices():
+    """The prices every lookup sees during the test, which it can change as it goes."""
+    previous = market.provider
+    fixed = FixedMarket({"AAPL": 100.0, "MSFT": 200.0, "NVDA": 50.0})
+    market.use_provider(fixed)
+    yield fixed.prices
+    market.use_provider(previous)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path):
+    """Each storage backend in turn, empty, in place of the real database."""
+    previous = database.storage
+    if request.param == "sqlite":
+        database.use_storage(SQLiteStorage(str(tmp_path / "accounts.db")))
+    else:
+        database.use_storage(database.create_storage("memory"))
+    yield database.storage
+    database.use_storage(previous)
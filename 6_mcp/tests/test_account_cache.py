@@ -0,0 +1,76 @@
+import pytest
+import database
+from account_cache import AccountCache
+from accounts import Account
+
+
+@pytest.fixture
+def cache(storage, prices):
+    # A write-behind long enough that nothing is written until the test flushes
+    return AccountCache(ttl=60, write_behind=3600)
+
+
+def stored_values(name: str) -> int:
+    return len(Account.get(name).portfolio_value_time_series)
+
+
+def test_reports_are_written_behind(cache):
+    cache.use("alice", lambda account: account.summary())
+    cache.use("alice", lambda account: account.summary())
+    assert stored_values("alice") == 0
+    assert cache.stats()["dirty"] == 1
+    cache.flush()
+    assert stored_values("alice") == 2
+    assert cache.stats()["flushes"] == 1 and cache.stats()["dirty"] == 0
+
+
+def test_trades_are_written_at_once(cache):
+    cache.use("alice", lambda account: account.summary())
+    cache.use("alice", lambda account: account.buy_shares("AAPL", 1, "Now"))
+    saved = Account.get("alice")
+    assert saved.holdings == {"AAPL": 1}
+    # The trade's save carries the value deferred before it
+    assert len(saved.portfolio_value_time_series) == 1
+
+
+def test_deferred_values_survive_another_process_saving(cache):
+    cache.use("alice", lambda account: account.summary())
+    Account.get("alice").buy_shares("AAPL", 3, "Elsewhere")
+    cache.flush()
+    saved = Account.get("alice")
+    assert saved.holdings == {"AAPL": 3}
+    assert len(saved.portfolio_value_time_series) == 1
+    assert cache.stats()["failures"] == 0
+
+
+def test_failed_flush_is_kept_and_raised_to_the_next_caller(cache, monkeypatch):
+    cache.use("alice", lambda account: account.summary())
+    update_account = database.storage.update_account
+
+    def broken(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(database.storage, "update_account", broken)
+    with pytest.raises(OSError):
+        cache.flush()
+    with pytest.raises(OSError):
+        cache.use("alice", lambda account: account.balance)
+    assert cache.stats()["failing"] == 1
+    monkeypatch.setattr(database.storage, "update_account", update_account)
+    assert cache.use("alice", lambda account: account.balance) == 10_000.0
+    assert stored_values("alice") == 1
+    assert cache.stats()["failing"] == 0
+
+
+def test_failed_operation_drops_the_cached_account(cache):
+    cache.use("alice", lambda account: account.summary())
+
+    def refuse_after_changing(account):
+        account.balance = 0.0
+        raise ValueError("refused")
+
+    with pytest.raises(ValueError):
+        cache.use("alice", refuse_after_changing)
+    assert cache.use("alice", lambda account: account.balance) == 10_000.0
+    cache.flush()
+    assert stored_values("alice") == 1
@@ -0,0 +1,76 @@
+import json
+import database
+import pytest
+from accounts import Account, Order
+
+
+def test_buy_then_sell_in_one_batch(storage, prices):
+    account = Account.get("alice")
+    result = json.loads(account.execute_orders([
+        Order(symbol="AAPL", side="buy", quantity=10, rationale="Open"),
+        Order(symbol="AAPL", side="sell", quantity=4, rationale="Trim"),
+    ]))
+    assert [(t["symbol"], t["quantity"]) for t in result["executed"]] == [("AAPL", 10), ("AAPL", -4)]
+    saved = Account.get("alice")
+    assert saved.holdings == {"AAPL": 6}
+    assert [lot["quantity"] for lot in saved.get_lots("AAPL")] == [6]
+    saved.verify_cost_basis()
+
+
+def test_sell_of_a_lot_opened_earlier_in_the_batch(storage, prices):
+    account = Account.get("alice")
+    account.buy_shares("AAPL", 5, "First lot")
+    account.execute_orders([
+        Order(symbol="AAPL", side="buy", quantity=3, rationale="Second lot"),
+        Order(symbol="AAPL", side="sell", quantity=3, rationale="Close it", lot_ids=[1]),
+    ])
+    assert Account.get("alice").get_lots("AAPL")[0]["lot_id"] == 0
+    assert Account.get("alice").holdings == {"AAPL": 5}
+
+
+def test_rejected_batch_changes_nothing(storage, prices):
+    account = Account.get("alice")
+    with pytest.raises(ValueError):
+        account.execute_orders([
+            Order(symbol="AAPL", side="buy", quantity=10, rationale="Open"),
+            Order(symbol="AAPL", side="sell", quantity=11, rationale="Oversell"),
+        ])
+    saved = Account.get("alice")
+    assert saved.holdings == {} and saved.balance == account.balance == 10_000.0
+    assert len(saved.transactions) == 0
+
+
+def test_trade_details_come_from_memory(storage, prices, monkeypatch):
+    account = Account.get("alice")
+    account.buy_shares("MSFT", 2, "Earlier")
+    saves, logs = [], []
+    monkeypatch.setattr("accounts.update_account", lambda *args: saves.append(args) or args[1] + 1)
+    monkeypatch.setattr("accounts.write_log", lambda *args: logs.append(args))
+    details = json.loads(account.buy_shares("AAPL", 3, "Add").split("\n", 1)[1])
+    assert len(saves) == 1 and len(logs) == 1
+    assert [t["rationale"] for t in details["recent_transactions"]] == ["Add"]
+    assert {h["symbol"]: h["value"] for h in details["holdings"]} == {"AAPL": 300.0, "MSFT": 400.0}
+
+
+def test_lots_rebuilt_for_a_legacy_account_survive_a_reload(storage, prices):
+    # Saved before lots were tracked: no lot method and no lot rows, so loading rebuilds them
+    database.write_account("alice", {
+        "name": "alice",
+        "balance": 5_000.0,
+        "strategy": "",
+        "holdings": {"AAPL": 10, "MSFT": 5},
+        "transactions": [
+            {"symbol": "AAPL", "quantity": 10, "price": 100.0, "timestamp": "2025-01-01 10:00:00", "rationale": "Old"},
+            {"symbol": "MSFT", "quantity": 5, "price": 200.0, "timestamp": "2025-01-01 11:00:00", "rationale": "Old"},
+        ],
+        "portfolio_value_time_series": [],
+    })
+    account = Account.get("alice")
+    account.reload()
+    account.buy_shares("NVDA", 1, "New")
+    saved = Account.get("alice")
+    assert saved.lot_method == "FIFO"
+    assert [lot["quantity"] for lot in saved.get_lots("AAPL")] == [10]
+    assert [lot["quantity"] for lot in saved.get_lots("MSFT")] == [5]
+    saved.sell_shares("AAPL", 1, "Still sellable")
+    saved.verify_cost_basis()
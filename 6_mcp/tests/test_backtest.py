@@ -0,0 +1,37 @@
+import pytest
+import database
+from backtest import ReplayMarket, equal_weight, random_trades, run_backtest
+
+
+@pytest.fixture
+def history(storage):
+    for day, (aapl, msft) in enumerate([(100.0, 200.0), (101.0, 198.0), (99.0, 205.0), (103.0, 207.0)], start=1):
+        database.write_prices(f"2025-01-0{day}", {"AAPL": aapl, "MSFT": msft})
+    # A day with none of the symbols the backtest trades
+    database.write_prices("2025-01-05", {"XYZ": 10.0})
+    database.write_prices("2025-01-06", {"AAPL": 104.0, "MSFT": 210.0})
+
+
+def test_days_without_the_symbols_are_skipped(history):
+    replay = ReplayMarket(["AAPL", "MSFT"])
+    assert "2025-01-05" not in replay.dates and len(replay.dates) == 5
+    assert ReplayMarket(["AAPLL"]).dates == []
+
+
+def test_random_policy_runs_and_repeats(history):
+    replay = ReplayMarket(["AAPL", "MSFT"])
+    first = run_backtest(replay, random_trades(3))
+    second = run_backtest(replay, random_trades(3))
+    assert first["rejected"] == 0 and first["trades"] > 0
+    assert first["final_value"] == second["final_value"]
+    assert random_trades(3)(None, {}, 0) == []
+
+
+def test_equal_weight(history):
+    results = run_backtest(ReplayMarket(["AAPL", "MSFT"]), equal_weight)
+    assert results["rejected"] == 0 and results["days"] == 5
+
+
+def test_unknown_symbols_have_nothing_to_replay(history):
+    with pytest.raises(ValueError):
+        run_backtest(ReplayMarket(["AAPLL"]), equal_weight)
@@ -0,0 +1,64 @@
+import os
+from datetime import datetime, timedelta, timezone
+import pytest
+import database
+import log_archive
+from value_series import TIME_FORMAT
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    """An empty archive directory for the test, in place of the real one."""
+    path = str(tmp_path / "logs_archive")
+    monkeypatch.setattr(log_archive, "ARCHIVE_DIR", path)
+    return path
+
+
+def ago(**delta) -> str:
+    return (datetime.now(timezone.utc) - timedelta(**delta)).strftime(TIME_FORMAT)
+
+
+def test_old_entries_roll_into_the_archive(storage):
+    old, recent = ago(days=10), ago(minutes=5)
+    database.write_logs([
+        ("alice", old, "trace", "old alice"),
+        ("bob", old, "trace", "old bob"),
+        ("alice", recent, "trace", "new alice"),
+    ])
+    assert database.roll_logs(max_age_days=7) == 2
+    assert os.path.exists(log_archive.archive_path(old[:10]))
+    # Without a start the live table is enough; with one the archive fills in what has rolled out
+    assert [row[2] for row in database.read_log("alice")] == ["new alice"]
+    assert database.read_log("alice", since=old[:10]) == [(old, "trace", "old alice"), (recent, "trace", "new alice")]
+    assert [row[2] for row in database.read_log("bob", since=old[:10])] == ["old bob"]
+    assert database.read_log("alice", since=old[:10], until=recent) == [(old, "trace", "old alice")]
+    assert database.roll_logs(max_age_days=7) == 0
+
+
+def test_rows_over_the_cap_roll_oldest_first(storage):
+    now = datetime.now(timezone.utc)
+    database.write_logs([
+        ("alice", (now - timedelta(minutes=10 - i)).strftime(TIME_FORMAT), "trace", f"entry {i}") for i in range(10)
+    ])
+    assert database.roll_logs(max_rows=4) == 6
+    assert [row[3] for row in database.read_log_since("alice")] == [f"entry {i}" for i in range(6, 10)]
+    since = (now - timedelta(hours=1)).strftime(TIME_FORMAT)
+    assert [row[2] for row in database.read_log("alice", last_n=7, since=since)] == [f"entry {i}" for i in range(3, 10)]
+    assert [row[2] for row in database.read_log("alice", last_n=20, since=since)] == [f"entry {i}" for i in range(10)]
+
+
+def test_archive_reads_skip_entries_still_live(archive_dir):
+    log_archive.append([
+        (1, "alice", "2025-01-01 09:00:00", "trace", "first"),
+        (2, "alice", "2025-01-02 09:00:00", "trace", "second"),
+        (3, "bob", "2025-01-02 10:00:00", "trace", "other"),
+    ])
+    # Rolling an entry again after a failed delete appends a second copy; reads keep one
+    log_archive.append([(2, "alice", "2025-01-02 09:00:00", "trace", "second")])
+    assert log_archive.read("Alice", "2025-01-01") == [
+        (1, "2025-01-01 09:00:00", "trace", "first"),
+        (2, "2025-01-02 09:00:00", "trace", "second"),
+    ]
+    assert [row[0] for row in log_archive.read("alice", "2025-01-01", before_id=2)] == [1]
+    assert [row[0] for row in log_archive.read("alice", "2025-01-01", until="2025-01-02")] == [1]
+    assert log_archive.read("alice", "2025-01-03") == []
@@ -0,0 +1,32 @@
+import threading
+import time
+import database
+from log_writer import LogWriter
+
+
+def test_full_queue_drops_without_blocking(monkeypatch):
+    release = threading.Event()
+    # Hold the writer thread inside its first batch, so the queue fills up behind it
+    monkeypatch.setattr("log_writer.write_logs", lambda batch: release.wait())
+    writer = LogWriter(batch_size=1, max_queued=5)
+    writer.write("alice", "trace", "first")
+    time.sleep(0.1)
+    threads = [threading.Thread(target=lambda: [writer.write("alice", "trace", "more") for _ in range(50)]) for _ in range(4)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.perf_counter() - started < 1
+    assert writer.dropped == 4 * 50 - 5
+    release.set()
+    writer.shutdown(5)
+
+
+def test_entries_are_written_in_batches(storage):
+    writer = LogWriter(batch_size=10, flush_interval=0.05)
+    for i in range(25):
+        writer.write("alice", "trace", f"entry {i}")
+    assert writer.force_flush(5)
+    assert [row[2] for row in database.read_log("alice", last_n=25)] == [f"entry {i}" for i in range(25)]
+    writer.shutdown(5)
@@ -0,0 +1,61 @@
+import pytest
+from ledger import Transaction
+from lots import FIFO, LIFO, SPECIFIC, LotBook
+
+
+def book() -> LotBook:
+    lots = LotBook()
+    lots.buy(0, "AAPL", 10, 100.0, "2025-01-01 10:00:00")
+    lots.buy(1, "AAPL", 10, 120.0, "2025-01-02 10:00:00")
+    return lots
+
+
+def test_fifo_sells_the_oldest_lots_first():
+    lots = book()
+    assert lots.sell("AAPL", 15, 130.0, FIFO) == pytest.approx(10 * 30 + 5 * 10)
+    assert lots.open_lots("AAPL") == [(1, 5, 120.0, "2025-01-02 10:00:00")]
+
+
+def test_lifo_sells_the_newest_lots_first():
+    lots = book()
+    assert lots.sell("AAPL", 15, 130.0, LIFO) == pytest.approx(10 * 10 + 5 * 30)
+    assert lots.open_lots("AAPL") == [(0, 5, 100.0, "2025-01-01 10:00:00")]
+
+
+def test_specific_sells_the_named_lots_in_order():
+    lots = book()
+    assert lots.sell("AAPL", 12, 130.0, SPECIFIC, [1, 0]) == pytest.approx(10 * 10 + 2 * 30)
+    assert lots.open_lots("AAPL") == [(0, 8, 100.0, "2025-01-01 10:00:00")]
+    assert lots.pnl({"AAPL": 110.0})["AAPL"] == {"quantity": 8, "cost": 800.0, "realized": 160.0, "unrealized": 80.0}
+
+
+def test_a_sale_the_lots_cannot_cover_changes_nothing():
+    lots = book()
+    for args in [
+        ("AAPL", 21, 130.0, FIFO),
+        ("AAPL", 5, 130.0, SPECIFIC),
+        ("AAPL", 5, 130.0, FIFO, [7]),
+        ("AAPL", 5, 130.0, FIFO, [0, 0]),
+        ("AAPL", 11, 130.0, FIFO, [0]),
+        ("AAPL", 1, 130.0, "AVERAGE"),
+    ]:
+        with pytest.raises(ValueError):
+            lots.sell(*args)
+    assert lots.open_lots("AAPL") == book().open_lots("AAPL")
+    assert lots.realized == {}
+
+
+def test_replay_matches_recording_as_you_go():
+    transactions = [
+        Transaction(symbol="AAPL", quantity=10, price=100.0, timestamp="2025-01-01 10:00:00", rationale=""),
+        Transaction(symbol="MSFT", quantity=3, price=200.0, timestamp="2025-01-01 11:00:00", rationale=""),
+        Transaction(symbol="AAPL", quantity=5, price=110.0, timestamp="2025-01-02 10:00:00", rationale=""),
+        Transaction(symbol="AAPL", quantity=-12, price=120.0, timestamp="2025-01-03 10:00:00", rationale=""),
+    ]
+    for method in (FIFO, LIFO):
+        recorded = LotBook()
+        for lot_id, transaction in enumerate(transactions):
+            recorded.record(lot_id, transaction, method)
+        replayed = LotBook.replay(transactions, method)
+        assert {s: list(l) for s, l in replayed.lots.items()} == {s: list(l) for s, l in recorded.lots.items()}
+        assert replayed.realized == pytest.approx(recorded.realized)
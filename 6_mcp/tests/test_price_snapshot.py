@@ -0,0 +1,65 @@
+import threading
+import market
+from price_snapshot import KEY_WIDTH, PriceSnapshot, remove_snapshots_before, snapshot_path, write_snapshot
+
+
+def test_round_trip(tmp_path):
+    prices = {"MSFT": 420.5, "AAPL": 190.25, "BRK.B": 410.0, "A": 120.0, "X" * (KEY_WIDTH + 1): 1.0}
+    path = str(tmp_path / "prices.bin")
+    assert write_snapshot(path, prices) == 4
+    snapshot = PriceSnapshot(path)
+    assert len(snapshot) == 4
+    for symbol in ("MSFT", "AAPL", "BRK.B", "A"):
+        assert snapshot.get(symbol) == prices[symbol]
+    assert snapshot.get("NVDA") is None
+    assert snapshot.get("X" * (KEY_WIDTH + 1)) is None
+    assert snapshot.get_many(["AAPL", "NVDA", "A"]) == {"AAPL": 190.25, "A": 120.0}
+    snapshot.close()
+
+
+def test_empty_snapshot(tmp_path):
+    path = str(tmp_path / "prices.bin")
+    write_snapshot(path, {})
+    assert PriceSnapshot(path).get("AAPL") is None
+
+
+def test_remove_snapshots_before(tmp_path):
+    for date in ("2025-01-01", "2025-01-02", "2025-01-03"):
+        write_snapshot(snapshot_path(date, str(tmp_path)), {"AAPL": 1.0})
+    remove_snapshots_before("2025-01-03", str(tmp_path))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["prices-2025-01-03.bin"]
+
+
+def test_new_day_closes_earlier_maps(tmp_path, monkeypatch):
+    monkeypatch.setattr(market, "snapshot_path", lambda date: snapshot_path(date, str(tmp_path)))
+    monkeypatch.setattr(market, "_snapshots", {})
+    for date, price in (("2025-01-01", 1.0), ("2025-01-02", 2.0)):
+        write_snapshot(snapshot_path(date, str(tmp_path)), {"AAPL": price})
+    assert market.read_prior_day_prices("2025-01-01", ["AAPL"]) == {"AAPL": 1.0}
+    first = market._snapshots["2025-01-01"]
+    assert market.read_prior_day_prices("2025-01-02", ["AAPL", "MSFT"]) == {"AAPL": 2.0}
+    assert first._map.closed
+    assert list(market._snapshots) == ["2025-01-02"]
+
+
+def test_lookups_racing_a_new_day_never_see_a_closed_map(tmp_path, monkeypatch):
+    monkeypatch.setattr(market, "snapshot_path", lambda date: snapshot_path(date, str(tmp_path)))
+    monkeypatch.setattr(market, "_snapshots", {})
+    dates = [f"2025-02-{day:02d}" for day in range(1, 21)]
+    for date in dates:
+        write_snapshot(snapshot_path(date, str(tmp_path)), {f"S{i}": float(i) for i in range(1000)})
+    errors = []
+
+    def look_up(date):
+        try:
+            for _ in range(200):
+                assert market.read_prior_day_prices(date, ["S1", "S999"]) == {"S1": 1.0, "S999": 999.0}
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=look_up, args=(date,)) for date in dates]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+import pytest
+import database
+from accounts import Account, SPREAD
+from value_series import HOURLY, TIME_FORMAT
+from sqlite_storage import SQLiteStorage
+from storage import ConcurrentUpdateError
+
+
+def test_rationales_load_from_the_ledger_that_was_read(storage, prices):
+    account = Account.get("alice")
+    account.buy_shares("AAPL", 1, "First")
+    account.buy_shares("MSFT", 1, "Second")
+    ledger = database.read_account("alice")["transactions"]
+    assert [t["rationale"] for t in ledger.to_dicts()] == ["First", "Second"]
+
+    stale = database.read_account("alice")["transactions"]
+    account.reset("New strategy")
+    account.buy_shares("NVDA", 1, "After the reset")
+    if isinstance(storage, SQLiteStorage):
+        # The rationales are still to be fetched, and the rows they belonged to are gone
+        with pytest.raises(ConcurrentUpdateError):
+            stale.to_dicts()
+    else:
+        assert [t["rationale"] for t in stale.to_dicts()] == ["First", "Second"]
+    assert [t.rationale for t in Account.get("alice").transactions] == ["After the reset"]
+
+
+def test_connections_are_kept_per_thread(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "accounts.db"))
+    assert storage.connect() is storage.connect()
+    others = []
+    thread = threading.Thread(target=lambda: others.append(storage.connect()))
+    thread.start()
+    thread.join()
+    assert others[0] is not storage.connect()
+    assert storage.connect().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_stale_write_is_refused(storage, prices):
+    first, second = Account.get("alice"), Account.get("alice")
+    first.deposit(100)
+    with pytest.raises(ConcurrentUpdateError):
+        database.write_account("alice", second.model_dump(), expected_version=second._version)
+    with pytest.raises(ConcurrentUpdateError):
+        database.update_account("alice", second._version, {"balance": 1.0}, {}, [], [])
+    assert Account.get("alice").balance == 10_100.0
+
+
+def test_losing_save_is_retried_on_the_latest_state(storage, prices):
+    first, second = Account.get("alice"), Account.get("alice")
+    first.buy_shares("AAPL", 10, "First")
+    # second still has the version from before that buy, so its save conflicts, reloads and retries
+    second.buy_shares("MSFT", 5, "Second")
+    saved = Account.get("alice")
+    assert saved.holdings == {"AAPL": 10, "MSFT": 5}
+    assert [t.rationale for t in saved.transactions] == ["First", "Second"]
+    assert saved.balance == pytest.approx(10_000 - 10 * 100 * (1 + SPREAD) - 5 * 200 * (1 + SPREAD))
+    saved.verify_cost_basis()
+
+
+def test_ledger_round_trip(storage, prices):
+    account = Account.get("alice")
+    account.buy_shares("AAPL", 10, "Open")
+    account.sell_shares("AAPL", 4, "Trim")
+    saved = Account.get("alice")
+    assert saved.transactions.to_dicts() == account.transactions.to_dicts()
+    assert saved.holdings == {"AAPL": 6}
+    assert saved._version == account._version
+
+
+def test_a_late_create_keeps_the_account_another_process_made(storage, prices, monkeypatch):
+    account = Account.get("alice")
+    account.buy_shares("AAPL", 10, "First")
+    # This process read no account before the other one created it and traded
+    reads = [None]
+    monkeypatch.setattr("accounts.read_account", lambda name: reads.pop() if reads else database.read_account(name))
+    late = Account.get("alice")
+    assert late.holdings == {"AAPL": 10} and late._version == account._version
+    saved = Account.get("alice")
+    assert saved.holdings == {"AAPL": 10}
+    assert [lot["quantity"] for lot in saved.get_lots("AAPL")] == [10]
+    account.sell_shares("AAPL", 1, "The first process's version still holds")
+
+
+def test_legacy_json_tables_are_migrated_and_dropped(tmp_path, prices):
+    path = str(tmp_path / "accounts.db")
+    now = datetime.now(timezone.utc)
+    recent, older = (now - timedelta(hours=1)).strftime(TIME_FORMAT), (now - timedelta(days=3)).strftime(TIME_FORMAT)
+    legacy = {
+        "name": "alice",
+        "balance": 8_000.0,
+        "strategy": "Buy and hold",
+        "holdings": {"AAPL": 20},
+        "transactions": [
+            {"symbol": "AAPL", "quantity": 20, "price": 100.0, "timestamp": older, "rationale": "Long term"},
+        ],
+        "portfolio_value_time_series": [[older, 10_000.0], [recent, 10_050.0]],
+    }
+    # The layout databases had before accounts and prices were split into columns
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE accounts (name TEXT PRIMARY KEY, account TEXT)")
+        conn.execute("CREATE TABLE market (date TEXT PRIMARY KEY, data TEXT)")
+        conn.execute("INSERT INTO accounts VALUES (?, ?)", ("alice", json.dumps(legacy)))
+        conn.execute("INSERT INTO market VALUES (?, ?)", ("2025-01-02", json.dumps({"AAPL": 101.5, "MSFT": 202.0})))
+    conn.close()
+
+    storage = SQLiteStorage(path)
+    tables = {row[0] for row in storage.connect().execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "accounts_json" not in tables and "market" not in tables
+    assert storage.read_market("2025-01-02") == {"AAPL": 101.5, "MSFT": 202.0}
+    account = storage.read_account("alice")
+    assert account["balance"] == 8_000.0 and account["strategy"] == "Buy and hold"
+    assert account["holdings"] == {"AAPL": 20}
+    assert [t["rationale"] for t in account["transactions"].to_dicts()] == ["Long term"]
+    # Points older than the raw retention survive only in the rollups
+    assert account["portfolio_value_time_series"] == [(recent, 10_050.0)]
+    assert [b[0] for b in storage.read_portfolio_values("alice", HOURLY)] == [older[:13] + ":00:00", recent[:13] + ":00:00"]
+
+    # A second open finds nothing left to migrate, and leaves the migrated rows alone
+    assert SQLiteStorage(path).read_account("alice")["holdings"] == {"AAPL": 20}
+    previous = database.storage
+    database.use_storage(storage)
+    try:
+        migrated = Account.get("alice")
+        assert migrated.lot_method == "FIFO"
+        assert [lot["quantity"] for lot in migrated.get_lots("AAPL")] == [20]
+        migrated.verify_cost_basis()
+    finally:
+        database.use_storage(previous)
@@ -0,0 +1,54 @@
+import database
+import value_series
+from accounts import Account
+from value_series import RAW, HOURLY, DAILY
+
+
+def record(name: str, points: list[tuple[str, float]]) -> None:
+    """Append points to an account's value history in one save, as Account does."""
+    account = Account.get(name)
+    database.update_account(name, account._version, {}, {}, [], points)
+
+
+def test_points_roll_up_into_hourly_and_daily_buckets(storage, prices):
+    record("alice", [
+        ("2025-03-10 09:15:00", 100.0),
+        ("2025-03-10 09:45:00", 120.0),
+        ("2025-03-10 10:05:00", 90.0),
+    ])
+    # A later save extends the bucket it lands in rather than starting another
+    record("alice", [("2025-03-10 10:30:00", 95.0)])
+    assert [tuple(b) for b in database.read_portfolio_values("alice", HOURLY)] == [
+        ("2025-03-10 09:00:00", 100.0, 120.0, 100.0, 120.0),
+        ("2025-03-10 10:00:00", 90.0, 95.0, 90.0, 95.0),
+    ]
+    assert [tuple(b) for b in database.read_portfolio_values("alice", DAILY)] == [
+        ("2025-03-10 00:00:00", 100.0, 120.0, 90.0, 95.0),
+    ]
+    assert [b[0] for b in database.read_portfolio_values("alice", RAW, since="2025-03-10 10:00:00")] == [
+        "2025-03-10 10:05:00", "2025-03-10 10:30:00",
+    ]
+    assert [b[0] for b in database.read_portfolio_values("alice", HOURLY, since="2025-03-10 10:20:00")] == [
+        "2025-03-10 10:00:00",
+    ]
+
+
+def test_each_tier_expires_at_its_own_retention(storage, prices):
+    record("alice", [("2025-01-01 12:00:00", 100.0), ("2025-03-09 12:00:00", 110.0)])
+    record("alice", [("2025-03-10 11:00:00", 120.0)])
+    # Measured back from the newest point: a day of raw points, 30 days of hours, 5 years of days
+    assert [b[0] for b in database.read_portfolio_values("alice", RAW)] == ["2025-03-09 12:00:00", "2025-03-10 11:00:00"]
+    assert [b[0] for b in database.read_portfolio_values("alice", HOURLY)] == [
+        "2025-03-09 12:00:00", "2025-03-10 11:00:00",
+    ]
+    assert [b[0] for b in database.read_portfolio_values("alice", DAILY)] == [
+        "2025-01-01 00:00:00", "2025-03-09 00:00:00", "2025-03-10 00:00:00",
+    ]
+    record("alice", [("2025-03-10 12:30:00", 130.0)])
+    assert [b[0] for b in database.read_portfolio_values("alice", RAW)] == ["2025-03-10 11:00:00", "2025-03-10 12:30:00"]
+
+
+def test_resolution_for_picks_the_finest_tier_that_covers_the_window():
+    assert value_series.resolution_for("2025-03-10 00:00:00", "2025-03-10 23:00:00") == RAW
+    assert value_series.resolution_for("2025-03-01 00:00:00", "2025-03-10 00:00:00") == HOURLY
+    assert value_series.resolution_for("2024-03-01 00:00:00", "2025-03-10 00:00:00") == DAILY
@@ -4,6 +4,8 @@ import asyncio
 from tracers import LogTracer
 from agents import add_trace_processor
 from market import is_market_open
+from database import roll_logs
+from async_database import run_blocking
 from dotenv import load_dotenv
 import os
 
@@ -42,10 +44,14 @@ async def run_every_n_minutes():
     add_trace_processor(LogTracer())
     traders = create_traders()
     while True:
-        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open():
+        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or await run_blocking(is_market_open):
             await asyncio.gather(*[trader.run() for trader in traders])
         else:
             print("Market is closed, skipping run")
+        # Rolling may vacuum the database, so keep it off the event loop the traders run on
+        archived = await run_blocking(roll_logs)
+        if archived:
+            print(f"Archived {archived} log entries")
         await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
 
 
@@ -0,0 +1,80 @@
+import os
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# An account's portfolio value is kept at three resolutions: every reported point for the last
+# day, then hourly and daily open/high/low/close buckets, so its history takes bounded space
+# however often it is reported.
+RAW = "raw"
+HOURLY = "hour"
+DAILY = "day"
+
+RAW_RETENTION_HOURS = int(os.getenv("RAW_VALUE_RETENTION_HOURS", "24"))
+HOURLY_RETENTION_DAYS = int(os.getenv("HOURLY_VALUE_RETENTION_DAYS", "30"))
+DAILY_RETENTION_DAYS = int(os.getenv("DAILY_VALUE_RETENTION_DAYS", "1825"))
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def bucket(timestamp: str, resolution: str) -> str:
+    """Return the start of the bucket a 'YYYY-MM-DD HH:MM:SS' timestamp falls in at a resolution."""
+    if resolution == HOURLY:
+        return timestamp[:13] + ":00:00"
+    elif resolution == DAILY:
+        return timestamp[:10] + " 00:00:00"
+    return timestamp
+
+
+def cutoffs(latest: str) -> dict[str, str]:
+    """Return, for each resolution, the oldest timestamp or bucket still kept once latest is recorded."""
+    now = datetime.strptime(latest, TIME_FORMAT)
+    return {
+        RAW: (now - timedelta(hours=RAW_RETENTION_HOURS)).strftime(TIME_FORMAT),
+        HOURLY: bucket((now - timedelta(days=HOURLY_RETENTION_DAYS)).strftime(TIME_FORMAT), HOURLY),
+        DAILY: bucket((now - timedelta(days=DAILY_RETENTION_DAYS)).strftime(TIME_FORMAT), DAILY),
+    }
+
+
+def roll_up(buckets: list[list], resolution: str, timestamp: str, value: float) -> None:
+    """Fold a point into a time-ordered list of [bucket, open, high, low, close]."""
+    start = bucket(timestamp, resolution)
+    if buckets and buckets[-1][0] == start:
+        last = buckets[-1]
+        last[2] = max(last[2], value)
+        last[3] = min(last[3], value)
+        last[4] = value
+    else:
+        buckets.append([start, value, value, value, value])
+
+
+def expire(points: list, before: str) -> int:
+    """Drop the points or buckets that start before a cutoff from a time-ordered list; return how many."""
+    end = bisect_left(points, before, key=lambda point: point[0])
+    del points[:end]
+    return end
+
+
+def record(raw: list[tuple[str, float]], rollups: dict[str, list[list]], values: list[tuple[str, float]]) -> None:
+    """Append (datetime, value) points to raw and the rollups, then expire whatever is past retention."""
+    for timestamp, value in values:
+        raw.append((timestamp, value))
+        for resolution, buckets in rollups.items():
+            roll_up(buckets, resolution, timestamp, value)
+    if values:
+        limits = cutoffs(max(timestamp for timestamp, _ in values))
+        expire(raw, limits[RAW])
+        for resolution, buckets in rollups.items():
+            expire(buckets, limits[resolution])
+
+
+def resolution_for(start: str, end: str) -> str:
+    """Return the finest resolution that still covers the window from start to end."""
+    span = datetime.strptime(end, TIME_FORMAT) - datetime.strptime(start, TIME_FORMAT)
+    if span <= timedelta(hours=RAW_RETENTION_HOURS):
+        return RAW
+    elif span <= timedelta(days=HOURLY_RETENTION_DAYS):
+        return HOURLY
+    return DAILY